@@ -1,16 +1,53 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import requests
-import xlrd
-import os
-import urllib
-import ssl
-from datetime import datetime, date, timedelta
+from datetime import datetime
 import time
-import json
-from typing import Dict, Tuple, Optional
-import io
+from typing import Dict, List
+import threading
+from streamlit.delta_generator import DeltaGenerator
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from core import (
+    CACHE_FRESH_SECONDS,
+    CURRENCIES,
+    FUND_CODES,
+    FUND_CONFIG,
+    POLL_INTERVAL,
+    QUOTE_FETCH_TIMEOUT,
+    QUOTE_SYMBOLS,
+    UNDERLYINGS,
+    MarketDataPoller,
+    calculate_scenario_grid,
+    export_to_tsv,
+    fetch_all_data,
+    get_live_prices,
+    prepare_funds,
+    rate_limiter,
+    scenario_table,
+    stale_quotes,
+)
+
+from diagnostics import diagnostics
+from export import (
+    EXPORT_FORMATS,
+    export_file,
+    history_export,
+    history_metrics_export,
+    holdings_export,
+    trades_export,
+)
+from incremental import RebalanceGraph
+from orders import contract_symbols, format_orders, route_orders
+from snapshot import SNAPSHOT_DIR, SnapshotMarketData, SnapshotReader
+from tracker import LiveTracker
+
+# Points per drift chart: each tick redraws it, so it shows the last hour
+# rather than the whole session's ring buffer
+LIVE_CHART_TICKS = 3600 // POLL_INTERVAL
+
+# Seconds before funds that failed to fetch are tried again on a rerun; each
+# attempt can block the page for up to FUND_FETCH_TIMEOUT
+FAILED_RETRY_SECONDS = 2 * 60
 
 # Configure page
 st.set_page_config(
@@ -19,319 +56,125 @@ st.set_page_config(
     layout="wide"
 )
 
-# Cache configuration
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_cached_data():
-    """Cache data to reduce API calls"""
-    return {}
+@st.cache_resource
+def get_snapshot_reader() -> SnapshotReader:
+    """Serving mode: one reader of the data worker's snapshot per server process"""
+    return SnapshotReader(SNAPSHOT_DIR)
 
-# Rate limiting helper
-class RateLimiter:
-    def __init__(self, max_calls_per_minute=60):
-        self.max_calls = max_calls_per_minute
-        self.calls = []
-    
-    def can_call(self):
-        now = time.time()
-        # Remove calls older than 1 minute
-        self.calls = [call_time for call_time in self.calls if now - call_time < 60]
-        return len(self.calls) < self.max_calls
-    
-    def record_call(self):
-        self.calls.append(time.time())
+@st.cache_resource
+def get_market_poller():
+    """One quote source per server process, shared by every session
 
-# Global rate limiter - much more conservative
-rate_limiter = RateLimiter(max_calls_per_minute=10)
+    The background poller, or in serving mode the data worker's published quotes.
+    """
+    if SNAPSHOT_DIR:
+        return SnapshotMarketData(get_snapshot_reader())
+    return MarketDataPoller(QUOTE_SYMBOLS, POLL_INTERVAL)
 
-def safe_yfinance_call(ticker_symbol: str, retries: int = 3) -> Optional[float]:
-    """Safely call yfinance with rate limiting and retries"""
-    if not rate_limiter.can_call():
-        st.warning("Rate limit reached. Using cached data.")
-        return None
-    
-    try:
-        import yfinance as yf
-        rate_limiter.record_call()
-        
-        ticker = yf.Ticker(ticker_symbol)
-        
-        # Try different methods to get price data
-        try:
-            # Method 1: Use fast_info
-            price = ticker.fast_info.last_price
-            if price and price > 0:
-                return price
-        except Exception as e:
-            # Silently continue to next method
-            pass
-        
-        try:
-            # Method 2: Use history with error handling
-            hist = ticker.history(period='1d', interval='1m')
-            if not hist.empty and len(hist) > 0:
-                last_price = hist['Close'].iloc[-1]
-                if last_price and last_price > 0:
-                    return last_price
-        except Exception as e:
-            # Silently continue to next method
-            pass
-        
-        try:
-            # Method 3: Use info with specific error handling
-            info = ticker.info
-            if info and 'regularMarketPrice' in info and info['regularMarketPrice']:
-                return info['regularMarketPrice']
-        except KeyError as e:
-            # Handle KeyError for missing keys like 'currentTradingPeriod'
-            if 'currentTradingPeriod' in str(e):
-                # Try to get price from other available fields
-                try:
-                    if 'regularMarketPrice' in info:
-                        return info['regularMarketPrice']
-                    elif 'previousClose' in info:
-                        return info['previousClose']
-                    elif 'open' in info:
-                        return info['open']
-                except:
-                    pass
-        except Exception as e:
-            # Silently continue to next method
-            pass
-        
-        return None
-        
-    except Exception as e:
-        # Don't show error for every failed symbol, just log it
-        return None
+def get_rebalance_graph() -> RebalanceGraph:
+    """This session's memoized metrics graph, kept across reruns"""
+    if "rebalance_graph" not in st.session_state:
+        st.session_state["rebalance_graph"] = RebalanceGraph(FUND_CONFIG)
+    return st.session_state["rebalance_graph"]
 
-def get_fx_rate() -> float:
-    """Get JPY exchange rate with minimal API calls"""
-    # Try yfinance first
-    fx_rate = safe_yfinance_call('JPY=X')
-    if fx_rate and 100 < fx_rate < 200:  # Reasonable JPY range
-        return fx_rate
-    
-    # Use reasonable default
-    st.warning("Using default JPY rate. Consider checking manually for accuracy.")
-    return 150.0  # Default JPY rate
+def get_live_tracker() -> LiveTracker:
+    """This session's drift history, kept across reruns"""
+    if "live_tracker" not in st.session_state:
+        st.session_state["live_tracker"] = LiveTracker()
+    return st.session_state["live_tracker"]
 
-def get_futures_price() -> float:
-    """Get live ES futures price using minimal API calls"""
-    
-    # Only try the most reliable symbols to minimize API calls
-    symbols_to_try = [
-        "ES=F",      # E-mini S&P 500 continuous (most reliable)
-        "SPY"        # S&P 500 ETF (convert to ES equivalent)
-    ]
-    
-    for symbol in symbols_to_try:
-        try:
-            price = safe_yfinance_call(symbol)
-            if price and price > 0:
-                # If using SPY, convert to ES equivalent (SPY * 50)
-                if symbol == "SPY":
-                    price = price * 50
-                # Validate price range
-                if 4000 < price < 7000:  # Reasonable ES range
-                    return price
-        except Exception as e:
-            continue
-    
-    # Final fallback - use a reasonable default
-    st.warning("Using default ES futures price. Consider using manual input for accuracy.")
-    return 5200.0  # Reasonable default for current market
+def render_live_tracker() -> Dict[str, DeltaGenerator]:
+    """Draw the session's drift and rebalance history; returns the chart slots for append_live_tick"""
+    tracker = get_live_tracker()
+    st.caption(f"Live weight minus target weight (rolling mean over {tracker.window} ticks) and the "
+               "implied rebalance, one point per quote update over the last hour.")
+    live_charts = {}
+    for field, title in [("rolling_drift", "Weight Drift vs. Target"), ("target_trade", "Implied Rebalance (Micros)")]:
+        st.write(f"**{title}**")
+        slot = st.empty()
+        live_charts[field] = slot
+        slot.line_chart(tracker.frame(field, rows=LIVE_CHART_TICKS))
+    return live_charts
 
-def download_fund_data(fund_code: str) -> Tuple[pd.DataFrame, pd.DataFrame, float]:
-    """Download and parse fund data with error handling"""
-    try:
-        YearMonth = date.today().strftime('%Y%m')
-        link = f'https://www.nikkoam.com/files/etf/_shared/xls/portfolio/{fund_code}_{YearMonth}.xls'
-        
-        # Create SSL context that ignores certificate verification
-        import ssl
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # Create opener with SSL context
-        opener = urllib.request.build_opener(urllib.request.HTTPSHandler(context=ssl_context))
-        urllib.request.install_opener(opener)
-        
-        # Download file
-        fileName, headers = urllib.request.urlretrieve(link)
-        
-        # Read workbook
-        wb = xlrd.open_workbook(fileName, logfile=open(os.devnull, 'w'))
-        
-        # Get fund data
-        fundData = pd.read_excel(wb, header=None, usecols="A,C", skiprows=1, nrows=10, engine='xlrd').T
-        fundData.columns = fundData.iloc[0]
-        fundData = fundData[1:]
-        fundData = fundData.infer_objects()
-        
-        # Get positions
-        FundPositions = pd.read_excel(wb, skiprows=range(1, 13), skipfooter=3, header=1, engine='xlrd')
-        
-        # Get NAV
-        nav = fundData['AUM*1'].iloc[0]
-        
-        # Clean up downloaded file
-        os.remove(fileName)
-        
-        return FundPositions, fundData, nav
-        
-    except Exception as e:
-        st.error(f"Error downloading data for fund {fund_code}: {str(e)}")
-        return pd.DataFrame(), pd.DataFrame(), 0.0
+def append_live_tick(live_charts: Dict[str, DeltaGenerator], tracker: LiveTracker):
+    """Redraw the drift charts with the tick just recorded
 
-def calculate_fund_metrics(fund_code: str, nav: float, cf_factor: float, 
-                          fx_rate: float, futures_price: float, 
-                          fund_positions: pd.DataFrame) -> Dict:
-    """Calculate fund metrics"""
-    try:
-        # Get futures positions
-        fut_positions = fund_positions[fund_positions.Category == "Future"]
-        
-        if fut_positions.empty:
-            return {
-                'cur_fut_position': 0,
-                'target_position': 0,
-                'target_trade': 0,
-                'live_fund_weight': 0,
-                'prev_inv_ratio': 0,
-                'fut_pct_change': 0
-            }
-        
-        # Calculate current position
-        cur_fut_position = fut_positions['Value(Local)'].sum() / 5 / fut_positions['Price'].mean()
-        
-        # Calculate percentage change
-        fut_pct_change = futures_price / fut_positions['Price'].mean() - 1
-        
-        # Set leverage ratio based on fund
-        lev_ratio = 2 if fund_code == "2239" else -1
-        
-        # Calculate target position
-        target_position = (lev_ratio * nav * (1 + lev_ratio * fut_pct_change) / 
-                         (fx_rate * 5 * futures_price) * cf_factor)
-        
-        # Calculate metrics
-        target_trade = target_position - cur_fut_position
-        live_fund_weight = cur_fut_position / target_position * lev_ratio if target_position != 0 else 0
-        prev_inv_ratio = fut_positions['Value(JPY)'].sum() / nav if nav != 0 else 0
-        
-        return {
-            'cur_fut_position': cur_fut_position,
-            'target_position': target_position,
-            'target_trade': target_trade,
-            'live_fund_weight': live_fund_weight,
-            'prev_inv_ratio': prev_inv_ratio,
-            'fut_pct_change': fut_pct_change
-        }
-        
-    except Exception as e:
-        st.error(f"Error calculating metrics for fund {fund_code}: {str(e)}")
-        return {
-            'cur_fut_position': 0,
-            'target_position': 0,
-            'target_trade': 0,
-            'live_fund_weight': 0,
-            'prev_inv_ratio': 0,
-            'fut_pct_change': 0
-        }
+    Streamlit has no in-place append (add_rows is gone), so each tick
+    replaces the chart; it holds only the last LIVE_CHART_TICKS ticks to keep
+    that redraw small, not the whole session in the ring buffer.
+    """
+    for field, slot in live_charts.items():
+        slot.line_chart(tracker.frame(field, rows=LIVE_CHART_TICKS))
 
-def export_to_tsv(fund_data: Dict) -> str:
-    """Export fund data to TSV format"""
-    tsv_data = []
-    
-    # Add header
-    tsv_data.append("Fund\tLive Weight\tTarget Trade (Micros)\tCurrent Position\tTarget Position\tInvestment Ratio")
-    
-    # Add fund data
-    for fund_code, data in fund_data.items():
-        tsv_data.append(f"{fund_code}\t{data['live_fund_weight']:.4f}\t{data['target_trade']:.1f}\t"
-                       f"{data['cur_fut_position']:.1f}\t{data['target_position']:.1f}\t{data['prev_inv_ratio']:.4f}")
-    
-    return "\n".join(tsv_data)
+def render_live_dashboard(fund_downloads: Dict, cf_values: Dict[str, float],
+                          manual_fx_rates: Dict[str, float], manual_futures_prices: Dict[str, float],
+                          live_charts: Dict[str, DeltaGenerator]):
+    """Render metrics, market data and export from the latest quote snapshot
 
-def main():
-    st.title("📊 Fund Tracker")
-    st.markdown("---")
+    Runs as a fragment, so auto-refresh re-renders just this part against the
+    poller's snapshot; the fund files are not fetched again. Each new snapshot
+    is also recorded as a tick and appended to the drift charts.
+    """
+    with diagnostics.timed("render_live"):
+        _render_live_dashboard(fund_downloads, cf_values, manual_fx_rates, manual_futures_prices, live_charts)
+
+def _render_live_dashboard(fund_downloads: Dict, cf_values: Dict[str, float],
+                           manual_fx_rates: Dict[str, float], manual_futures_prices: Dict[str, float],
+                           live_charts: Dict[str, DeltaGenerator]):
+    snapshot = get_market_poller().snapshot(timeout=QUOTE_FETCH_TIMEOUT)
+    quotes = snapshot["quotes"]
+    if snapshot["rate_limited"]:
+        st.warning("Rate limit reached. Using the last good quotes.")
+    stale = stale_quotes(snapshot)
+    if stale:
+        reason = f" ({snapshot['error']})" if snapshot["error"] else ""
+        st.warning("Stale quotes: " + ", ".join(f"{symbol} {age / 60:.0f} min old" for symbol, age in stale.items())
+                   + reason)
     
-    # Sidebar for inputs
-    with st.sidebar:
-        st.header("Configuration")
-        cf_2239 = st.number_input('2239 CF:', step=10000000.00, format="%f", value=0.0)
-        cf_2240 = st.number_input('2240 CF:', step=10000000.00, format="%f", value=0.0)
-        
-        st.markdown("---")
-        st.header("Market Data")
-        manual_futures = st.checkbox("Use manual futures price", value=False)
-        if manual_futures:
-            futures_price = st.number_input('ES Futures Price:', min_value=4000.0, max_value=7000.0, value=5200.0, step=1.0)
-        else:
-            futures_price = None
-            
-        manual_fx = st.checkbox("Use manual JPY rate", value=False)
-        if manual_fx:
-            fx_rate = st.number_input('JPY Rate:', min_value=100.0, max_value=200.0, value=150.0, step=0.1)
-        else:
-            fx_rate = None
-        
-        st.markdown("---")
-        st.header("Data Sources")
-        use_cached = st.checkbox("Use cached data (if available)", value=True)
-        
-        if st.button("🔄 Refresh Data"):
-            st.cache_data.clear()
-            st.rerun()
+    # Manual prices override the live quotes; no trade is sized off a missing one
+    ignore_warning = lambda message: None  # Reported below, unless a manual price covers it
+    fx_rates, futures_prices = get_live_prices(quotes, ignore_warning)
+    fx_rates.update(manual_fx_rates)
+    futures_prices.update(manual_futures_prices)
+    missing = ([f"{currency}/JPY rate" for currency, rate in fx_rates.items() if np.isnan(rate)]
+               + [f"{underlying} futures price" for underlying, price in futures_prices.items() if np.isnan(price)])
+    if missing:
+        st.error(f"No quote yet for the {' or '.join(missing)}. Enter it manually in the sidebar to size trades.")
+        return
     
-    # Get market data with rate limiting
-    with st.spinner("Fetching market data..."):
-        # Use manual FX rate if provided, otherwise fetch automatically
-        if fx_rate is None:
-            fx_rate = get_fx_rate()
-        
-        # Use manual futures price if provided, otherwise fetch automatically
-        if futures_price is None:
-            futures_price = get_futures_price()
+    # Only the funds whose inputs changed since the last rerun are recomputed
+    graph = get_rebalance_graph()
+    graph.update(fund_downloads, cf_values, fx_rates, futures_prices)
+    with diagnostics.timed("compute", source="incremental") as timing:
+        metrics_frame = graph.metrics(on_error=st.error)
+        timing["funds"] = len(metrics_frame)
+    fund_results = metrics_frame.to_dict('index')
+    orders = route_orders(metrics_frame['target_trade'], futures_prices)
+    symbols = contract_symbols(datetime.now().date())
     
-    # Process funds
-    fund_results = {}
+    tracker = get_live_tracker()
+    if snapshot["updated"] is not None and tracker.record(snapshot["updated"], metrics_frame, FUND_CONFIG,
+                                                          fx_rates, futures_prices):
+        append_live_tick(live_charts, tracker)
     
-    for fund_code in ["2239", "2240"]:
-        cf_value = cf_2239 if fund_code == "2239" else cf_2240
+    for fund_code, metrics in fund_results.items():
+        # Display results
+        col1, col2 = st.columns(2)
         
-        with st.spinner(f"Processing fund {fund_code}..."):
-            # Download fund data
-            fund_positions, fund_data, nav = download_fund_data(fund_code)
-            
-            if nav > 0:
-                cf_factor = (cf_value + nav) / nav
-                
-                # Calculate metrics
-                metrics = calculate_fund_metrics(
-                    fund_code, nav, cf_factor, fx_rate, futures_price, fund_positions
-                )
-                
-                fund_results[fund_code] = metrics
-                
-                # Display results
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.metric(
-                        label=f"Fund {fund_code} - Live Weight",
-                        value=f"{metrics['live_fund_weight']:+.2%}",
-                        delta=f"{metrics['target_trade']:.1f} Micros"
-                    )
-                
-                with col2:
-                    st.metric(
-                        label=f"Fund {fund_code} - Position",
-                        value=f"{metrics['cur_fut_position']:.1f}",
-                        delta=f"Target: {metrics['target_position']:.1f}"
-                    )
+        with col1:
+            st.metric(
+                label=f"Fund {fund_code} - Live Weight",
+                value=f"{metrics['live_fund_weight']:+.2%}",
+                delta=f"{metrics['target_trade']:.1f} Micros"
+            )
+        
+        with col2:
+            st.metric(
+                label=f"Fund {fund_code} - Position",
+                value=f"{metrics['cur_fut_position']:.1f}",
+                delta=f"Target: {metrics['target_position']:.1f}"
+            )
+        st.caption(f"Orders: {format_orders(orders.loc[fund_code], symbols)}")
     
     # Market data display
     st.markdown("---")
@@ -340,18 +183,29 @@ def main():
     col1, col2 = st.columns(2)
     
     with col1:
-        st.metric(
-            label="Futures Price",
-            value=f"{futures_price:.2f}",
-            delta=f"{fund_results.get('2239', {}).get('fut_pct_change', 0):+.2%}"
-        )
+        for underlying, futures_price in futures_prices.items():
+            # Change vs. the book price of the first fund holding this future
+            pct_change = next((fund_results[code]['fut_pct_change'] for code in fund_results
+                               if FUND_CONFIG.at[code, 'underlying'] == underlying), 0)
+            st.metric(
+                label=f"{underlying} Futures Price",
+                value=f"{futures_price:.2f}",
+                delta=f"{pct_change:+.2%}"
+            )
     
     with col2:
-        st.metric(
-            label="JPY Rate",
-            value=f"{fx_rate:.5f}",
-            delta="Current"
-        )
+        for currency, fx_rate in fx_rates.items():
+            st.metric(
+                label=f"{currency}/JPY Rate",
+                value=f"{fx_rate:.5f}",
+                delta="Current"
+            )
+    
+    if snapshot["quote_times"]:
+        st.caption("Quotes as of " + ", ".join(
+            f"{symbol} {datetime.fromtimestamp(fetched_at):%H:%M:%S}"
+            for symbol, fetched_at in snapshot["quote_times"].items()
+        ))
     
     # TSV Export
     st.markdown("---")
@@ -374,6 +228,27 @@ def main():
                 file_name=f"fund_trades_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tsv",
                 mime="text/tab-separated-values"
             )
+        
+        # Full exports are written batch by batch only when a button is clicked
+        fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key="export_format")
+        extension, mime = EXPORT_FORMATS[fmt]
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="💾 Trades and orders",
+                data=lambda: export_file(trades_export(metrics_frame, orders), fmt),
+                file_name=f"fund_trades_{stamp}.{extension}",
+                mime=mime,
+            )
+        with col2:
+            st.download_button(
+                label="💾 Holdings",
+                data=lambda: export_file(holdings_export(
+                    {code: fund_downloads[code] for code in fund_results}), fmt),
+                file_name=f"fund_holdings_{stamp}.{extension}",
+                mime=mime,
+            )
     
     # Additional information
     st.markdown("---")
@@ -383,10 +258,242 @@ def main():
         st.write("**Investment Ratios:**")
         for fund_code, data in fund_results.items():
             st.write(f"Fund {fund_code}: {data['prev_inv_ratio']:+.2%}")
+
+def render_scenario_grid(fund_downloads: Dict, cf_values: Dict[str, float],
+                         center_fx_rates: Dict[str, float], center_futures_prices: Dict[str, float]):
+    """Heat map of target trades across a futures price x JPY rate grid
+
+    The grid is computed from the already-downloaded positions, so changing
+    the ranges re-evaluates instantly without any fetch. It is centred on the
+    selected fund's underlying and currency.
+    """
+    funds, positions = prepare_funds(fund_downloads, cf_values)
+    if funds.empty:
+        st.info("No fund data available for scenarios.")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        fund_code = st.selectbox("Fund", list(funds.index))
+        steps = st.slider("Grid points per axis", 5, 100, 21)
+    with col2:
+        futures_range = st.slider("Futures price range (±%)", 0.5, 20.0, 5.0, 0.5)
+        fx_range = st.slider("JPY rate range (±%)", 0.5, 20.0, 3.0, 0.5)
+    with col3:
+        cf_text = st.text_input("CF amounts (comma separated)", value=f"{cf_values.get(fund_code, 0.0):.0f}")
+        metric = st.radio("Show", ["target_trade", "target_position"], horizontal=True)
+    
+    try:
+        cf_amounts = [float(value) for value in cf_text.split(",") if value.strip()] or [0.0]
+    except ValueError:
+        st.error("CF amounts must be numbers separated by commas.")
+        return
+    
+    # Only funds sharing the selected fund's price axes
+    underlying, currency = funds.loc[fund_code, ['underlying', 'currency']]
+    same_axes = (funds['underlying'] == underlying) & (funds['currency'] == currency)
+    funds, positions = funds[same_axes], positions[positions['fund_code'].isin(funds.index[same_axes])]
+    center_futures, center_fx = center_futures_prices[underlying], center_fx_rates[currency]
+    
+    futures_prices = center_futures * np.linspace(1 - futures_range / 100, 1 + futures_range / 100, steps)
+    fx_rates = center_fx * np.linspace(1 - fx_range / 100, 1 + fx_range / 100, steps)
+    grid = calculate_scenario_grid(funds, positions, futures_prices, fx_rates, cf_amounts)
+    
+    cf_index = 0
+    if len(cf_amounts) > 1:
+        cf_index = st.selectbox("CF scenario", range(len(cf_amounts)),
+                                format_func=lambda i: f"{cf_amounts[i]:,.0f}")
+    
+    table = scenario_table(grid, fund_code, cf_index, metric)
+    table.index = table.index.map(lambda price: f"{price:.2f}")
+    table.columns = table.columns.map(lambda rate: f"{rate:.2f}")
+    st.dataframe(table.style.background_gradient(cmap="RdYlGn", axis=None).format("{:.1f}"))
+
+def render_history():
+    """Charts of archived rebalance metrics, with an on-demand backfill"""
+    # pyarrow.dataset is only needed once someone opens the history
+    from archive import backfill_archive, history_metrics, load_history
+    
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        months = st.number_input("Months to backfill", min_value=1, max_value=120, value=24, step=1)
+        if st.button("📥 Backfill archive"):
+            with st.spinner("Downloading past portfolio files..."):
+                added = backfill_archive(FUND_CODES, int(months), on_error=st.error)
+            st.success(f"Archived {sum(len(year_months) for year_months in added.values())} new monthly files")
+    
+    history = load_history(FUND_CODES)
+    if history.empty:
+        with col1:
+            st.info("No archived holdings yet. Backfill to build the history.")
+        return
+    
+    metrics = history_metrics(history)
+    with col1:
+        metric = st.selectbox("Metric", ["live_fund_weight", "target_trade", "prev_inv_ratio", "cur_fut_position"])
+        st.line_chart(metrics.pivot(index="as_of", columns="fund_code", values=metric))
+        
+        fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key="history_export_format")
+        extension, mime = EXPORT_FORMATS[fmt]
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.download_button("💾 Archived holdings", data=lambda: export_file(history_export(FUND_CODES), fmt),
+                               file_name=f"fund_history.{extension}", mime=mime)
+        with col_b:
+            st.download_button("💾 History metrics",
+                               data=lambda: export_file(history_metrics_export(FUND_CODES), fmt),
+                               file_name=f"fund_history_metrics.{extension}", mime=mime)
+
+def render_diagnostics(run_started: float):
+    """Per-stage timings of this run plus rolling p50/p99 and metric exports"""
+    st.write("**This run:**")
+    run_records = diagnostics.records(since=run_started)
+    st.dataframe(run_records.drop(columns=["timestamp"]), hide_index=True)
+    
+    st.write("**Recent window (seconds):**")
+    st.dataframe(diagnostics.summary())
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Prometheus metrics", diagnostics.to_prometheus(),
+                           file_name="fundtracker.prom", mime="text/plain")
+    with col2:
+        st.download_button("JSON lines", diagnostics.to_jsonl(),
+                           file_name="fundtracker_metrics.jsonl", mime="application/x-ndjson")
+
+def main():
+    run_started = time.time()
+    st.title("📊 Fund Tracker")
+    st.markdown("---")
+    
+    # Sidebar for inputs
+    with st.sidebar:
+        st.header("Configuration")
+        cf_values = {
+            fund_code: st.number_input(f'{fund_code} CF:', step=10000000.00, format="%f", value=0.0)
+            for fund_code in FUND_CODES
+        }
+        
+        st.markdown("---")
+        st.header("Market Data")
+        manual_futures = st.checkbox("Use manual futures price", value=False)
+        futures_prices = {
+            underlying: st.number_input(f'{underlying} Futures Price:', min_value=config['price_min'],
+                                        max_value=config['price_max'], value=config['default_price'], step=1.0)
+            for underlying, config in UNDERLYINGS.iterrows()
+        } if manual_futures else {}
+            
+        manual_fx = st.checkbox("Use manual JPY rate", value=False)
+        fx_rates = {
+            currency: st.number_input(f'{currency}/JPY Rate:', min_value=config['fx_min'],
+                                      max_value=config['fx_max'], value=config['default_fx'], step=0.1)
+            for currency, config in CURRENCIES.iterrows()
+        } if manual_fx else {}
+        
+        auto_refresh = st.checkbox("Auto-refresh live prices", value=True)
+        
+        st.markdown("---")
+        st.header("Data Sources")
+        use_cached = st.checkbox("Use cached data (if available)", value=True)
+        
+        if st.button("🔄 Refresh Data"):
+            get_market_poller().refresh_now()
+            st.session_state["revalidate_cache"] = True
+            st.rerun()
+    
+    # Fetch fund files concurrently, each under its own deadline with the last
+    # cached copy as fallback; quotes come from the background poller.
+    # Sidebar edits rerun the script, so the parsed files are kept for the
+    # session and only fetched again once stale, on refresh or on a source change.
+    # Failed funds (no NAV) are retried on a rerun once FAILED_RETRY_SECONDS
+    # have passed (or on refresh), and their error stays on the page until
+    # the issuer serves them again.
+    revalidate = st.session_state.pop("revalidate_cache", False)
+    memo = st.session_state.get("fund_downloads")
+    
+    def fetch(fund_codes: List[str], max_cache_age: float) -> Dict:
+        with st.spinner("Fetching fund data..."):
+            ctx = get_script_run_ctx()
+            
+            def attach_ctx():
+                # Let st.error inside the download workers render on this page
+                if ctx is not None:
+                    add_script_run_ctx(threading.current_thread(), ctx)
+            
+            return fetch_all_data(fund_codes, use_cache=use_cached, max_cache_age=max_cache_age,
+                                  on_error=st.error, on_warning=st.warning, initializer=attach_ctx)
+    
+    if SNAPSHOT_DIR:
+        # Serving mode: the data worker fetches and parses once for every viewer
+        memo = {"downloads": get_snapshot_reader().fund_downloads()}
+        if not memo["downloads"]:
+            st.info("Waiting for the data worker's first snapshot...")
+    else:
+        if (revalidate or memo is None or memo["use_cached"] != use_cached
+                or time.time() - memo["fetched_at"] > CACHE_FRESH_SECONDS):
+            # Refresh still uses the disk cache, but revalidates it with the server
+            memo = {
+                "fetched_at": time.time(),
+                "use_cached": use_cached,
+                "downloads": fetch(FUND_CODES, 0 if revalidate else CACHE_FRESH_SECONDS),
+                "failed_at": time.time(),
+            }
+        else:
+            failed = [code for code in FUND_CODES
+                      if code not in memo["downloads"] or memo["downloads"][code][2] <= 0]
+            if failed and time.time() - memo["failed_at"] > FAILED_RETRY_SECONDS:
+                downloads = {**memo["downloads"], **fetch(failed, CACHE_FRESH_SECONDS)}
+                memo = {**memo, "downloads": {code: downloads[code] for code in FUND_CODES if code in downloads},
+                        "failed_at": time.time()}
+            elif failed:
+                retry_in = FAILED_RETRY_SECONDS - (time.time() - memo["failed_at"])
+                st.error(f"No data for fund {', '.join(failed)}. Retrying in {retry_in:.0f}s, or use Refresh Data.")
+        st.session_state["fund_downloads"] = memo
+    fund_downloads = memo["downloads"]
+    
+    # Live weight and target trade re-render on each poll without a full rerun.
+    # The drift charts sit below the dashboard but are drawn first, so each
+    # poll can append its tick to them in place.
+    live_area = st.container()
+    with st.expander("📉 Live Drift"):
+        live_charts = render_live_tracker()
+    live_dashboard = st.fragment(run_every=POLL_INTERVAL if auto_refresh else None)(render_live_dashboard)
+    with live_area:
+        live_dashboard(fund_downloads, cf_values, fx_rates, futures_prices, live_charts)
+    
+    # Scenario grid centred on the current (or manual) prices. The grid and the
+    # history only run while open, so their imports and scans stay off cold starts.
+    st.markdown("---")
+    scenario_expander = st.expander("🧮 Scenario Grid", key="scenario_open", on_change="rerun")
+    if scenario_expander.open:
+        with scenario_expander:
+            quotes = get_market_poller().snapshot()["quotes"]
+            ignore_warning = lambda message: None  # Already shown by the live dashboard
+            center_fx_rates, center_futures_prices = get_live_prices(quotes, ignore_warning)
+            # A what-if grid, so an unquoted price may centre on the registry default
+            center_fx_rates = {currency: CURRENCIES.at[currency, "default_fx"] if np.isnan(rate) else rate
+                               for currency, rate in center_fx_rates.items()}
+            center_futures_prices = {underlying: UNDERLYINGS.at[underlying, "default_price"] if np.isnan(price)
+                                     else price for underlying, price in center_futures_prices.items()}
+            render_scenario_grid(
+                fund_downloads, cf_values,
+                {**center_fx_rates, **fx_rates}, {**center_futures_prices, **futures_prices},
+            )
+    
+    # Archived history
+    history_expander = st.expander("📈 History", key="history_open", on_change="rerun")
+    if history_expander.open:
+        with history_expander:
+            render_history()
     
     # Error handling and status
     if not rate_limiter.can_call():
         st.warning("⚠️ Rate limit approaching. Consider using cached data.")
+    
+    with st.expander("🩺 Diagnostics"):
+        render_diagnostics(run_started)
 
 if __name__ == "__main__":
-    main()
+    with diagnostics.timed("render"):
+        main()
+    diagnostics.write_metrics_file()
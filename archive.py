@@ -0,0 +1,224 @@
+"""Historical holdings archive and rebalance-metric backfill
+
+Monthly portfolio files are stored append-only as Parquet, partitioned by
+fund code and YearMonth:
+
+    archive/fund_code=2239/year_month=202409/as_of=20240930.parquet
+
+Past months are archived once as their month-end file; running the archive
+daily (e.g. `python archive.py --today` from the end-of-day scheduler) adds one
+part per file date, taken from the workbook's own Date row, so a rerun or a
+weekend run doesn't add the same file twice. Existing parts are never rewritten.
+
+Usage:
+    python archive.py --months 24        # backfill the last 24 months
+    python archive.py --today            # append today's snapshot
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from core import FUND_CODES, FUND_CONFIG, POSITION_ARROW_FIELDS, download_fund_data, rebalance_formulas, to_positions
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.environ.get(
+    "FUND_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+)
+BACKFILL_WORKERS = 8
+
+# Columns of every part, with the types they are written in: the typed
+# position schema plus the NAV and snapshot date. Parts written before a
+# column was added read it back as null.
+ARCHIVE_COLUMNS = {
+    **dict(POSITION_ARROW_FIELDS),
+    "nav": pa.float64(),
+    "as_of": pa.string(),
+}
+# Summary labels of the file's own snapshot date, compared lower-cased
+DATE_LABELS = ("date", "as of", "as of date", "基準日")
+PARTITIONING = ds.partitioning(
+    pa.schema([("fund_code", pa.string()), ("year_month", pa.string())]), flavor="hive"
+)
+
+_write_lock = threading.Lock()
+
+def _part_path(fund_code: str, year_month: str, as_of: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, f"fund_code={fund_code}", f"year_month={year_month}", f"as_of={as_of}.parquet")
+
+def _month_end(year_month: str) -> str:
+    return (pd.Period(year_month, freq="M").end_time).strftime("%Y%m%d")
+
+def file_date(fund_data: pd.DataFrame) -> Optional[str]:
+    """The snapshot date the workbook's summary block states (YYYYMMDD), or None"""
+    for label in fund_data.columns:
+        if str(label).strip().casefold() in DATE_LABELS:
+            try:
+                stamp = pd.Timestamp(fund_data[label].iloc[0])
+            except (TypeError, ValueError):
+                return None
+            return None if pd.isna(stamp) else stamp.strftime("%Y%m%d")
+    return None
+
+def archive_snapshot(fund_code: str, year_month: str, as_of: str, positions: pd.DataFrame,
+                     nav: float, archive_dir: str = ARCHIVE_DIR) -> bool:
+    """Append one parsed portfolio file; returns False if that part already exists"""
+    path = _part_path(fund_code, year_month, as_of, archive_dir)
+    if os.path.exists(path) or positions.empty:
+        return False
+
+    # assign, not item assignment: to_positions may hand back the caller's frame
+    part = to_positions(positions).assign(nav=float(nav), as_of=as_of)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Dot-prefixed so dataset scans skip it until it is renamed into place
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp{threading.get_ident()}")
+    part.to_parquet(tmp_path, index=False)
+    with _write_lock:
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+    return True
+
+def archived_months(fund_code: str, archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """YearMonths that already have at least one part for a fund"""
+    fund_dir = os.path.join(archive_dir, f"fund_code={fund_code}")
+    if not os.path.isdir(fund_dir):
+        return []
+    return sorted(name.split("=", 1)[1] for name in os.listdir(fund_dir) if name.startswith("year_month="))
+
+def backfill_archive(fund_codes: List[str], months: int, archive_dir: str = ARCHIVE_DIR,
+                     on_error: Callable[[str], None] = logger.error) -> Dict[str, List[str]]:
+    """Download and archive past monthly files for each fund concurrently
+
+    Covers the `months` complete months before this one and skips any month
+    already in the archive, so reruns only fetch what is missing. Returns the
+    newly archived YearMonths per fund.
+    """
+    this_month = pd.Period(date.today(), freq="M")
+    wanted = [(this_month - offset).strftime("%Y%m") for offset in range(1, months + 1)]
+    done = {fund_code: set(archived_months(fund_code, archive_dir)) for fund_code in fund_codes}
+    tasks = [
+        (fund_code, year_month)
+        for fund_code in fund_codes
+        for year_month in wanted
+        if year_month not in done[fund_code]
+    ]
+
+    def fetch_and_archive(fund_code: str, year_month: str) -> bool:
+        positions, fund_data, nav = download_fund_data(fund_code, use_cache=False, on_error=on_error,
+                                                       year_month=year_month)
+        if nav <= 0:
+            return False
+        as_of = file_date(fund_data) or _month_end(year_month)
+        if as_of[:6] != year_month:
+            on_error(f"{fund_code}: the {year_month} file is dated {as_of}, not archived")
+            return False
+        return archive_snapshot(fund_code, year_month, as_of, positions, nav, archive_dir)
+
+    added = {fund_code: [] for fund_code in fund_codes}
+    with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS) as executor:
+        results = executor.map(lambda task: fetch_and_archive(*task), tasks)
+        for (fund_code, year_month), ok in zip(tasks, results):
+            if ok:
+                added[fund_code].append(year_month)
+    return added
+
+def load_history(fund_codes: Optional[List[str]] = None, archive_dir: str = ARCHIVE_DIR) -> pd.DataFrame:
+    """All archived positions as one frame, read column-pruned in a single dataset scan"""
+    columns = list(ARCHIVE_COLUMNS) + ["fund_code"]
+    if not os.path.isdir(archive_dir):
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(
+        archive_dir, format="parquet", partitioning=PARTITIONING,
+        schema=pa.schema(list(ARCHIVE_COLUMNS.items()) + [("fund_code", pa.string()), ("year_month", pa.string())]),
+        exclude_invalid_files=True,
+    )
+    filter_ = ds.field("fund_code").isin(fund_codes) if fund_codes else None
+    return dataset.to_table(columns=columns, filter=filter_).to_pandas()
+
+def daily_futures(history: pd.DataFrame) -> pd.DataFrame:
+    """Futures aggregates and NAV per archived (fund_code, as_of)"""
+    fut = history[history["Category"] == "Future"].groupby(["fund_code", "as_of"], observed=True).agg(
+        value_local=("Value(Local)", "sum"),
+        avg_price=("Price", "mean"),
+        value_jpy=("Value(JPY)", "sum"),
+    )
+    navs = history.groupby(["fund_code", "as_of"], observed=True)["nav"].first()
+    return fut.join(navs, how="inner")
+
+def history_metrics(history: pd.DataFrame, fund_config: pd.DataFrame = FUND_CONFIG,
+                    prices: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Rebalance metrics for every archived (fund, date) in one vectorized pass
+
+    Without market prices, each snapshot is evaluated at its own futures
+    price and the FX rate implied by its JPY and local values, giving the
+    holdings' deviation from target on that day. prices, indexed by as_of
+    with futures_price and fx_rate columns, overrides both.
+    """
+    frame = daily_futures(history).join(fund_config, on="fund_code", how="inner")
+
+    avg_price = frame["avg_price"].to_numpy(dtype=float)
+    value_local = frame["value_local"].to_numpy(dtype=float)
+    value_jpy = frame["value_jpy"].to_numpy(dtype=float)
+
+    if prices is not None:
+        as_of = frame.index.get_level_values("as_of")
+        futures_price = prices["futures_price"].reindex(as_of).to_numpy(dtype=float)
+        fx_rate = prices["fx_rate"].reindex(as_of).to_numpy(dtype=float)
+    else:
+        futures_price = avg_price
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fx_rate = value_jpy / value_local
+
+    metrics = pd.DataFrame(rebalance_formulas(
+        frame["leverage"].to_numpy(dtype=float), frame["multiplier"].to_numpy(dtype=float),
+        frame["nav"].to_numpy(dtype=float), 1.0, fx_rate, futures_price,
+        value_local, avg_price, value_jpy,
+    ), index=frame.index)
+    metrics = metrics.reset_index()
+    metrics["as_of"] = pd.to_datetime(metrics["as_of"], format="%Y%m%d")
+    return metrics.sort_values(["fund_code", "as_of"]).reset_index(drop=True)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill or extend the historical holdings archive")
+    parser.add_argument("--funds", nargs="+", default=FUND_CODES, help="Fund codes (default: %(default)s)")
+    parser.add_argument("--months", type=int, default=0, help="Backfill this many past months")
+    parser.add_argument("--today", action="store_true", help="Append today's snapshot of the current month")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    if args.months:
+        added = backfill_archive(args.funds, args.months)
+        for fund_code, year_months in added.items():
+            logger.info(f"{fund_code}: archived {len(year_months)} months")
+    if args.today:
+        for fund_code in args.funds:
+            positions, fund_data, nav = download_fund_data(fund_code)
+            if nav <= 0:
+                continue
+            # Dated by the file, not the clock: on a weekend or holiday the issuer
+            # still serves the last business day's file, which is archived already
+            as_of = file_date(fund_data)
+            if as_of is None:
+                logger.error(f"{fund_code}: the file states no date, not archived")
+            elif archive_snapshot(fund_code, as_of[:6], as_of, positions, nav):
+                logger.info(f"{fund_code}: archived {as_of}")
+            else:
+                logger.info(f"{fund_code}: {as_of} is already archived")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""Backtest of the rebalance rule over archived holdings and intraday bars
+
+Each archived day's holdings are replayed against futures and FX bars: at
+the parameter set's rebalance time the trade comes from the same formulas as
+the live dashboard (rebalance_formulas), and is then scored against the
+close, when the fund's exposure is measured:
+
+    slippage        cost of trading at the rebalance-time price (plus cost_bps)
+                    instead of the close, annual bps of NAV
+    tracking_error  annualised stdev of the return missed until the next
+                    archived day because the post-trade position differs from
+                    the close-time target
+    turnover        traded notional per year, as a multiple of NAV
+
+Archived days need not be consecutive (backfilled history is month-ends):
+returns run over the real gap to the next archived day and are scaled to one
+business day, and sums are annualised over the business days the archive
+spans. Sparse holdings sample one rebalance per gap, so run_backtest warns
+when they are not daily.
+
+Parameter sets vary the rebalance time, a drift band below which no trade
+is made, the trading cost, a scale on the cash flows and lot rounding. All
+parameter sets and days of one fund are evaluated as (parameter x day)
+arrays in one pass; funds run in parallel on a process pool.
+
+Holdings dated d are traded in the US session of d, in BACKTEST_TZ.
+
+Usage:
+    python backtest.py --start 2025-01-01 --times 10:00 14:00 15:30 --bands 0 0.01 0.02
+    python backtest.py --bars bars.parquet --cost-bps 0.5 1 --output results.csv
+"""
+import argparse
+import itertools
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core import (
+    CURRENCIES,
+    FUND_CODES,
+    FUND_CONFIG,
+    RATE_LIMIT_WAIT,
+    UNDERLYINGS,
+    rate_limiter,
+    rebalance_formulas,
+)
+
+logger = logging.getLogger(__name__)
+
+BACKTEST_TZ = "America/New_York"
+CLOSE_TIME = "16:00"
+TRADING_DAYS = 252
+
+PARAMETER_COLUMNS = ["rebalance_time", "band", "cost_bps", "cf_scale", "round_lots"]
+RESULT_COLUMNS = ["days", "trade_days", "slippage_bps", "tracking_error", "turnover", "mean_abs_exposure_error"]
+
+def parameter_grid(rebalance_times: Sequence[str], bands: Sequence[float] = (0.0,),
+                   cost_bps: Sequence[float] = (0.0,), cf_scales: Sequence[float] = (1.0,),
+                   round_lots: Sequence[bool] = (True,)) -> pd.DataFrame:
+    """Every combination of the given values, one parameter set per row"""
+    return pd.DataFrame(list(itertools.product(rebalance_times, bands, cost_bps, cf_scales, round_lots)),
+                        columns=PARAMETER_COLUMNS).rename_axis("param_id")
+
+def download_bars(symbols: Sequence[str], start: str, end: Optional[str] = None,
+                  interval: str = "60m") -> pd.DataFrame:
+    """Intraday closes per symbol from one batched yfinance download (60m bars reach back ~2 years)"""
+    if not rate_limiter.acquire(timeout=RATE_LIMIT_WAIT):
+        raise RuntimeError("Rate limit reached")
+    import yfinance as yf
+    data = yf.download(list(symbols), start=start, end=end, interval=interval, progress=False,
+                       threads=False, auto_adjust=False)
+    if data is None or data.empty:
+        raise RuntimeError(f"No bars returned for {', '.join(symbols)}")
+    close = data["Close"]
+    return close.to_frame(symbols[0]) if isinstance(close, pd.Series) else close
+
+def _prices_at(series: pd.Series, days: pd.DatetimeIndex, clock: str, tz: str) -> np.ndarray:
+    """Last price at or before clock on each day (NaN if that day has no bar by then)"""
+    series = series.dropna()
+    index = series.index.tz_convert(tz) if series.index.tz is not None else series.index.tz_localize(tz)
+    stamps = (days + pd.Timedelta(clock + ":00")).tz_localize(tz)
+    position = index.searchsorted(stamps, side="right") - 1
+    prices = series.to_numpy(dtype=float)[np.clip(position, 0, None)]
+    same_day = (position >= 0) & (index[np.clip(position, 0, None)].normalize().tz_localize(None) == days)
+    return np.where(same_day, prices, np.nan)
+
+def _market_series(bars: pd.DataFrame, config: pd.Series) -> Dict[str, pd.Series]:
+    """Futures price (the future, else its proxy scaled) and JPY rate series for one fund"""
+    underlying = UNDERLYINGS.loc[config["underlying"]]
+    if underlying["future_symbol"] in bars:
+        futures = bars[underlying["future_symbol"]]
+    elif underlying["proxy_symbol"] and underlying["proxy_symbol"] in bars:
+        futures = bars[underlying["proxy_symbol"]] * underlying["proxy_factor"]
+    else:
+        raise KeyError(f"No bars for {config['underlying']} ({underlying['future_symbol']})")
+    fx_symbol = CURRENCIES.at[config["currency"], "fx_symbol"]
+    if fx_symbol not in bars:
+        raise KeyError(f"No bars for {config['currency']}/JPY ({fx_symbol})")
+    return {"futures": futures, "fx": bars[fx_symbol]}
+
+def _simulate_fund(job: Dict) -> pd.DataFrame:
+    """All parameter sets of one fund over all its days, as (parameter x day) arrays"""
+    params = job["params"]
+    lev, multiplier = job["leverage"], job["multiplier"]
+    nav, cf = job["nav"], job["cf"]
+    value_local, avg_price, value_jpy = job["value_local"], job["avg_price"], job["value_jpy"]
+
+    # Prices at each parameter set's rebalance time: rows of the per-time tables
+    time_row = params["time_row"].to_numpy()
+    futures_price = job["futures_at"][time_row]
+    fx_rate = job["fx_at"][time_row]
+    band = params["band"].to_numpy(dtype=float)[:, None]
+    cost = params["cost_bps"].to_numpy(dtype=float)[:, None] / 1e4
+    cf_factor = (nav + params["cf_scale"].to_numpy(dtype=float)[:, None] * cf) / nav
+
+    decided = rebalance_formulas(lev, multiplier, nav, cf_factor, fx_rate, futures_price,
+                                 value_local, avg_price, value_jpy)
+    at_close = rebalance_formulas(lev, multiplier, nav, cf_factor, job["fx_close"], job["futures_close"],
+                                  value_local, avg_price, value_jpy)
+
+    valid = np.isfinite(decided["target_trade"]) & np.isfinite(at_close["target_position"])
+    trade = np.where(np.abs(decided["live_fund_weight"] - lev) > band, decided["target_trade"], 0.0)
+    trade = np.where(params["round_lots"].to_numpy(dtype=bool)[:, None], np.round(trade), trade)
+    trade = np.where(valid, trade, 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Exposure left off target at the close, as a fraction of the post-flow NAV
+        unit_value = multiplier * job["futures_close"] * job["fx_close"]
+        position_error = decided["cur_fut_position"] + trade - at_close["target_position"]
+        exposure_error = position_error * unit_value / (nav * cf_factor)
+        # Missed return over the gap to the next archived day, scaled to one business day
+        missed_return = np.where(valid, exposure_error * job["next_return"] / np.sqrt(job["gap_days"]), np.nan)
+
+        execution = futures_price * (1 + np.sign(trade) * cost)
+        slippage = np.where(valid, trade * multiplier * (execution - job["futures_close"]) * fx_rate / nav, 0.0)
+        turnover = np.where(valid, np.abs(trade) * multiplier * futures_price * fx_rate / nav, 0.0)
+
+    days = valid.sum(axis=1)
+    years = job["span_days"] / TRADING_DAYS
+    return params[PARAMETER_COLUMNS].assign(
+        fund_code=job["fund_code"],
+        days=days,
+        trade_days=(trade != 0).sum(axis=1),
+        slippage_bps=slippage.sum(axis=1) / years * 1e4,
+        tracking_error=np.nanstd(missed_return, axis=1) * np.sqrt(TRADING_DAYS),
+        turnover=turnover.sum(axis=1) / years,
+        mean_abs_exposure_error=np.nanmean(np.where(valid, np.abs(exposure_error), np.nan), axis=1),
+    )
+
+def _fund_job(fund_code: str, holdings: pd.DataFrame, bars: pd.DataFrame, params: pd.DataFrame,
+              times: List[str], config: pd.Series, cf_flows: Optional[pd.Series], close_time: str,
+              tz: str) -> Dict:
+    """One fund's day arrays and bar lookups, small enough to ship to a worker process"""
+    holdings = holdings.sort_index()
+    days = pd.DatetimeIndex(pd.to_datetime(holdings.index, format="%Y%m%d"))
+    dates = days.to_numpy().astype("datetime64[D]")
+    # Business days from each archived day to the next (NaN after the last)
+    gap_days = np.append(np.busday_count(dates[:-1], dates[1:]), np.nan).astype(float)
+    market = _market_series(bars, config)
+    futures_close = _prices_at(market["futures"], days, close_time, tz)
+    cf = np.zeros(len(days))
+    if cf_flows is not None and fund_code in cf_flows.index.get_level_values(0):
+        cf = cf_flows.loc[fund_code].reindex(days).fillna(0.0).to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        next_return = np.append(futures_close[1:] / futures_close[:-1] - 1, np.nan)
+    return {
+        "fund_code": fund_code,
+        "params": params.assign(time_row=params["rebalance_time"].map({t: i for i, t in enumerate(times)})),
+        "leverage": float(config["leverage"]),
+        "multiplier": float(config["multiplier"]),
+        "nav": holdings["nav"].to_numpy(dtype=float),
+        "cf": cf,
+        "value_local": holdings["value_local"].to_numpy(dtype=float),
+        "avg_price": holdings["avg_price"].to_numpy(dtype=float),
+        "value_jpy": holdings["value_jpy"].to_numpy(dtype=float),
+        "futures_at": np.array([_prices_at(market["futures"], days, t, tz) for t in times]),
+        "fx_at": np.array([_prices_at(market["fx"], days, t, tz) for t in times]),
+        "futures_close": futures_close,
+        "fx_close": _prices_at(market["fx"], days, close_time, tz),
+        "next_return": next_return,
+        "gap_days": np.where(gap_days > 0, gap_days, np.nan),
+        "span_days": max(np.busday_count(dates[0], dates[-1]) + 1, 1),
+    }
+
+def run_backtest(daily: pd.DataFrame, bars: pd.DataFrame, params: pd.DataFrame,
+                 fund_config: pd.DataFrame = FUND_CONFIG, cf_flows: Optional[pd.Series] = None,
+                 close_time: str = CLOSE_TIME, tz: str = BACKTEST_TZ,
+                 workers: Optional[int] = None) -> pd.DataFrame:
+    """Backtest every fund in daily against every parameter set
+
+    daily: futures aggregates and NAV per (fund_code, as_of), as from
+        archive.daily_futures
+    bars: intraday prices with a DatetimeIndex, one column per quote symbol
+    params: parameter sets, as from parameter_grid
+    cf_flows: optional cash flow in JPY per (fund_code, date)
+    workers: processes to spread funds over (1 runs in this process)
+
+    Returns one row per (fund_code, param_id) with the parameters and the
+    RESULT_COLUMNS.
+    """
+    times = list(dict.fromkeys(params["rebalance_time"]))
+    jobs = [
+        _fund_job(fund_code, holdings.droplevel("fund_code"), bars, params, times,
+                  fund_config.loc[fund_code], cf_flows, close_time, tz)
+        for fund_code, holdings in daily.groupby(level="fund_code", sort=False)
+        if fund_code in fund_config.index
+    ]
+    gaps = np.concatenate([job["gap_days"] for job in jobs]) if jobs else np.array([])
+    if np.isfinite(gaps).any() and np.nanmedian(gaps) > 1:
+        logger.warning(f"Archived holdings are {np.nanmedian(gaps):.0f} business days apart (median), not daily: "
+                       "each sampled day stands in for its whole gap, so results are only indicative")
+    if workers == 1 or len(jobs) <= 1:
+        results = [_simulate_fund(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_fund, jobs))
+    if not results:
+        return pd.DataFrame(columns=["fund_code", "param_id", *PARAMETER_COLUMNS, *RESULT_COLUMNS])
+    return pd.concat(results).reset_index().set_index(["fund_code", "param_id"])
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backtest the rebalance rule over the holdings archive")
+    parser.add_argument("--funds", nargs="+", default=FUND_CODES, help="Fund codes (default: %(default)s)")
+    parser.add_argument("--start", help="First holdings date, YYYY-MM-DD")
+    parser.add_argument("--end", help="Last holdings date, YYYY-MM-DD")
+    parser.add_argument("--times", nargs="+", default=["10:00", "12:00", "14:00", "15:00", "15:30"],
+                        help=f"Rebalance times in {BACKTEST_TZ} (default: %(default)s)")
+    parser.add_argument("--bands", nargs="+", type=float, default=[0.0, 0.005, 0.01, 0.02, 0.05],
+                        help="Drift from target leverage below which no trade is made")
+    parser.add_argument("--cost-bps", nargs="+", type=float, default=[0.5, 1.0], help="Trading cost per side")
+    parser.add_argument("--cf-scales", nargs="+", type=float, default=[1.0], help="Scale on --cf-file flows")
+    parser.add_argument("--cf-file", help="CSV of fund_code,date,amount cash flows (JPY)")
+    parser.add_argument("--bars", help="Parquet or CSV of intraday bars (default: download from yfinance)")
+    parser.add_argument("--interval", default="60m", help="Bar interval to download (default: %(default)s)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--output", "-o", help="Results file, .csv or .parquet (default: summary to stdout)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    # archive imports pyarrow.dataset; only the CLI's holdings scan needs it
+    from archive import daily_futures, load_history
+
+    daily = daily_futures(load_history(args.funds))
+    as_of = pd.to_datetime(daily.index.get_level_values("as_of"), format="%Y%m%d")
+    keep = np.ones(len(daily), dtype=bool)
+    if args.start:
+        keep &= as_of >= pd.Timestamp(args.start)
+    if args.end:
+        keep &= as_of <= pd.Timestamp(args.end)
+    daily = daily[keep]
+    if daily.empty:
+        logger.error("No archived holdings in range; run archive.py first")
+        return 1
+
+    if args.bars:
+        bars = pd.read_parquet(args.bars) if args.bars.endswith(".parquet") else pd.read_csv(
+            args.bars, index_col=0, parse_dates=True)
+    else:
+        config = FUND_CONFIG.loc[daily.index.unique("fund_code")]
+        symbols = list(dict.fromkeys([*UNDERLYINGS.loc[config["underlying"].unique(), "future_symbol"],
+                                      *CURRENCIES.loc[config["currency"].unique(), "fx_symbol"]]))
+        first = as_of[keep].min()
+        bars = download_bars(symbols, start=first.strftime("%Y-%m-%d"), interval=args.interval)
+
+    cf_flows = None
+    if args.cf_file:
+        flows = pd.read_csv(args.cf_file, dtype={"fund_code": str}, parse_dates=["date"])
+        cf_flows = flows.groupby(["fund_code", "date"])["amount"].sum()
+
+    params = parameter_grid(args.times, args.bands, args.cost_bps, args.cf_scales)
+    logger.info(f"{daily.index.unique('fund_code').size} funds x {len(params)} parameter sets")
+    results = run_backtest(daily, bars, params, cf_flows=cf_flows, workers=args.workers)
+
+    if args.output:
+        if args.output.endswith(".parquet"):
+            results.reset_index().to_parquet(args.output, index=False)
+        else:
+            results.to_csv(args.output)
+    else:
+        summary = results.groupby(PARAMETER_COLUMNS)[RESULT_COLUMNS[2:]].mean()
+        print(summary.sort_values("tracking_error").head(20).to_string())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Import-time report for the app's entry points
+
+Runs each module in a fresh interpreter under `python -X importtime` and
+reports the wall-clock import time plus the slowest top-level packages it
+pulled in, so cold-start regressions show up as a named dependency rather
+than a vague "startup got slower":
+
+    python benchmarks/import_time.py                 # table to stdout
+    python benchmarks/import_time.py --json          # JSON, for --baseline diffs
+    python benchmarks/import_time.py --modules core cli
+
+Times are the median of --repeat fresh processes; the OS file cache is warm
+after the first run, so they track container restarts rather than first boot.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_MODULES = ["core", "cli", "incremental", "tracker", "archive", "streamlit", "Hello"]
+
+# Hello.py calls st.set_page_config at import; bare mode only logs a warning for it
+_IMPORT_SNIPPET = "import sys; sys.path.insert(0, {root!r}); import {module}"
+
+def import_profile(module: str) -> Dict:
+    """Total and per-top-level-package cumulative import time (ms) in a fresh interpreter"""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_SNIPPET.format(root=ROOT, module=module)],
+        capture_output=True, text=True, cwd=ROOT, env=env,
+    )
+    packages: Dict[str, float] = defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        # Self times add up without double counting, so attribute them per top-level package
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return {"module": module, "total_ms": total, "packages": dict(packages),
+            "ok": result.returncode == 0}
+
+def report(modules: List[str], repeat: int) -> List[Dict]:
+    results = []
+    for module in modules:
+        runs = [import_profile(module) for _ in range(repeat)]
+        packages = {name: statistics.median(run["packages"].get(name, 0.0) for run in runs)
+                    for name in runs[0]["packages"]}
+        results.append({
+            "module": module,
+            "ok": all(run["ok"] for run in runs),
+            "total_ms": statistics.median(run["total_ms"] for run in runs),
+            "packages": dict(sorted(packages.items(), key=lambda item: -item[1])),
+        })
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=ENTRY_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=6, help="Packages listed per module (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    results = report(args.modules, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    for result in results:
+        status = "" if result["ok"] else "  (import failed)"
+        print(f"{result['module']:<12} {result['total_ms']:8.1f} ms{status}")
+        for name, ms in list(result["packages"].items())[:args.top]:
+            print(f"    {name:<24} {ms:8.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
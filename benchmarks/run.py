@@ -0,0 +1,201 @@
+"""Offline benchmark of the fetch -> parse -> compute -> export pipeline
+
+Replays the portfolio files in fixtures/ through a local HTTP server standing
+in for the issuer, and a recorded yf.download response for quotes, so runs
+are reproducible without network access. The fixtures follow the Nikko
+workbook layout (summary block in rows 1-10, positions from row 13, three
+footer rows); every synthetic fund code maps onto one of them.
+
+Each scenario runs at 2, 50 and 500 funds by default, with the portfolio
+cache cold (download + parse + store) and warm (served from disk):
+
+    python benchmarks/run.py                          # JSON results to stdout
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline results.json  # exit 1 on regressions
+
+Results are plain JSON: one entry per (scenario, funds) with the p50/p99/mean
+latency in milliseconds and the throughput in items per second.
+"""
+import argparse
+import http.server
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_FILES = sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith(".xls"))
+FUND_COUNTS = (2, 50, 500)
+
+# Keep the benchmark cache away from the real one; must be set before core is imported
+_cache_root = tempfile.mkdtemp(prefix="fundtracker-bench-")
+os.environ["FUND_CACHE_DIR"] = os.path.join(_cache_root, "portfolio")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """Serve fixture workbooks for any {fund_code}_{YearMonth}.xls path
+
+    A fund with its own fixture ({fund_code}.xls) gets it; synthetic fund
+    codes are spread over the fixtures by a hash of the code.
+    """
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the issuer's server
+    contents: Dict[str, bytes] = {}
+
+    def do_GET(self):
+        fund_code = self.path.rsplit("/", 1)[-1].split("_", 1)[0]
+        body = self.contents.get(fund_code)
+        if body is None:
+            fixtures = list(self.contents.values())
+            body = fixtures[sum(map(ord, fund_code)) % len(fixtures)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.ms-excel")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fixture_server() -> http.server.ThreadingHTTPServer:
+    FixtureHandler.contents = {os.path.splitext(name)[0]: open(os.path.join(FIXTURES_DIR, name), "rb").read()
+                               for name in FIXTURE_FILES}
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def recorded_download(tickers, **kwargs) -> pd.DataFrame:
+    """Replay the recorded yf.download response in fixtures/quotes.json"""
+    with open(os.path.join(FIXTURES_DIR, "quotes.json")) as f:
+        recorded = json.load(f)
+    index = pd.to_datetime(recorded["index"])
+    columns = pd.MultiIndex.from_product([["Close"], tickers], names=["Price", "Ticker"])
+    values = np.column_stack([recorded["close"][ticker] for ticker in tickers])
+    return pd.DataFrame(values, index=index, columns=columns)
+
+def measure(fn: Callable[[], object], repeat: int, items: int) -> Dict:
+    """Latency stats in ms over repeat calls, and items processed per second"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings_ms = np.asarray(timings) * 1000
+    return {
+        "repeat": repeat,
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "mean_ms": float(timings_ms.mean()),
+        "throughput_per_s": float(items / (statistics.mean(timings) or float("inf"))),
+    }
+
+def fund_config_for(count: int) -> pd.DataFrame:
+    """Synthetic fund table alternating 2x leveraged and -1x inverse funds"""
+    codes = [f"B{i:04d}" for i in range(count)]
+    return pd.DataFrame(
+        {"leverage": [2 if i % 2 == 0 else -1 for i in range(count)], "multiplier": 5, "currency": "USD"},
+        index=pd.Index(codes, name="fund_code"),
+    )
+
+def run(fund_counts=FUND_COUNTS, repeat: int = 10) -> Dict:
+    server = start_fixture_server()
+    port = server.server_address[1]
+
+    import core
+    import yfinance
+
+    core.PORTFOLIO_URL = f"http://127.0.0.1:{port}/{{fund_code}}_{{year_month}}.xls"
+    core.rate_limiter = core.RateLimiter(max_calls_per_minute=10 ** 9)
+    core.FUND_FETCH_TIMEOUT = 3600  # Measure throughput, not the page's give-up deadline
+    yfinance.download = recorded_download
+
+    results = []
+
+    def add(scenario: str, funds: int, stats: Dict):
+        results.append({"scenario": scenario, "funds": funds, **stats})
+
+    fixture_bytes = list(FixtureHandler.contents.values())
+    add("parse", 1, measure(lambda: [core.parse_fund_workbook(b) for b in fixture_bytes],
+                            repeat * 5, len(fixture_bytes)))
+    add("quotes", 3, measure(lambda: core.download_quotes(core.QUOTE_SYMBOLS), repeat, 3))
+
+    for count in fund_counts:
+        config = fund_config_for(count)
+        codes = list(config.index)
+        fetch_repeat = max(1, repeat // (10 if count >= 100 else 4))
+
+        def cold_fetch():
+            core.fund_cache.clear()
+            return core.fetch_all_data(codes)
+
+        add("fetch_cold", count, measure(cold_fetch, fetch_repeat, count))
+        downloads = core.fetch_all_data(codes)
+        add("fetch_warm", count, measure(lambda: core.fetch_all_data(codes), fetch_repeat, count))
+        add("fetch_nocache", count, measure(lambda: core.fetch_all_data(codes, use_cache=False), fetch_repeat, count))
+
+        cf_values = {code: 1e9 for code in codes}
+        add("compute", count, measure(
+            lambda: core.compute_rebalance(downloads, cf_values, 151.2, 5650.0, fund_config=config), repeat, count))
+        metrics = core.compute_rebalance(downloads, cf_values, 151.2, 5650.0, fund_config=config).to_dict("index")
+        add("export_tsv", count, measure(lambda: core.export_to_tsv(metrics), repeat, count))
+
+    server.shutdown()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+def compare(current: Dict, baseline: Dict, threshold: float, min_delta_ms: float) -> List[str]:
+    """Scenarios whose p50 grew by more than threshold times, and min_delta_ms over, the baseline"""
+    previous = {(r["scenario"], r["funds"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["scenario"], result["funds"]))
+        if (before and result["p50_ms"] > before["p50_ms"] * threshold
+                and result["p50_ms"] - before["p50_ms"] > min_delta_ms):
+            regressions.append(f"{result['scenario']}[{result['funds']}]: "
+                               f"{before['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--funds", type=int, nargs="+", default=list(FUND_COUNTS))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", "-o", help="Write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Allowed p50 slowdown vs. baseline (default: %(default)s)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Ignore p50 changes smaller than this (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    current = run(args.funds, args.repeat)
+    output = json.dumps(current, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(current, json.load(f), args.threshold, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Headless rebalance run: fetch, parse, compute and export without Streamlit
+
+Examples:
+    python cli.py
+    python cli.py --cf 2239=1e9 --cf 2240=-5e8 --futures 5650 --fx 151.2
+    python cli.py --format json --output trades.json
+    python cli.py --format parquet --output trades.parquet
+"""
+import argparse
+import json
+import logging
+import math
+import sys
+from datetime import date
+from typing import Dict, List, Optional
+
+from core import (
+    FUND_CODES,
+    FUND_CONFIG,
+    QUOTE_SYMBOLS,
+    compute_rebalance,
+    export_to_tsv,
+    fetch_market_data,
+    get_futures_price,
+    get_fx_rate,
+    refreshed_market_snapshot,
+    stale_quotes,
+    stored_market_snapshot,
+)
+
+from orders import contract_symbols, route_orders
+
+logger = logging.getLogger("cli")
+
+def parse_cf(values: List[str]) -> Dict[str, float]:
+    """Parse repeated FUND=AMOUNT arguments"""
+    cf_values = {}
+    for value in values:
+        fund_code, sep, amount = value.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected FUND=AMOUNT, got {value!r}")
+        cf_values[fund_code] = float(amount)
+    return cf_values
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Compute fund rebalance trades without the dashboard")
+    parser.add_argument("--funds", nargs="+", default=FUND_CODES, help="Fund codes (default: %(default)s)")
+    parser.add_argument("--cf", action="append", default=[], metavar="FUND=AMOUNT",
+                        help="Cash flow for a fund, repeatable")
+    parser.add_argument("--futures", type=float, help="Manual futures price, for every underlying")
+    parser.add_argument("--fx", type=float, help="Manual JPY rate, for every currency")
+    parser.add_argument("--format", choices=["tsv", "json", "parquet"], default="tsv")
+    parser.add_argument("--output", "-o", help="Output file (default: stdout; required for parquet)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the on-disk portfolio cache")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+
+    unknown = [code for code in args.funds if code not in FUND_CODES]
+    if unknown:
+        parser.error(f"Unknown fund codes: {', '.join(unknown)}")
+    if args.format == "parquet" and not args.output:
+        parser.error("--output is required for parquet")
+    try:
+        cf_values = parse_cf(args.cf)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    # Fund files and quotes in one gather; quotes only when a manual price is missing.
+    # Symbols the download misses fall back to their last-known-good stored quote.
+    symbols = QUOTE_SYMBOLS if args.fx is None or args.futures is None else ()
+    fund_downloads, quotes = fetch_market_data(args.funds, symbols, use_cache=not args.no_cache)
+    market = refreshed_market_snapshot(stored_market_snapshot(symbols), quotes) if symbols else None
+    if market:
+        quotes = market["quotes"]
+        for symbol, age in stale_quotes(market).items():
+            logger.warning(f"Using a stored {symbol} quote from {age / 60:.0f} minutes ago")
+    fund_config = FUND_CONFIG.loc[args.funds]
+    fx_rates = {
+        currency: args.fx if args.fx is not None else get_fx_rate(quotes, currency=currency)
+        for currency in fund_config["currency"].unique()
+    }
+    futures_prices = {
+        underlying: args.futures if args.futures is not None else get_futures_price(quotes, underlying=underlying)
+        for underlying in fund_config["underlying"].unique()
+    }
+
+    missing = [name for name, price in [*fx_rates.items(), *futures_prices.items()] if math.isnan(price)]
+    if missing:
+        logger.error(f"No quote for {', '.join(missing)}; pass --fx/--futures to size trades")
+        return 1
+
+    metrics_frame = compute_rebalance(fund_downloads, cf_values, fx_rates, futures_prices)
+    if metrics_frame.empty:
+        logger.error("No fund data available")
+        return 1
+
+    if args.format == "parquet":
+        metrics_frame.reset_index().to_parquet(args.output, index=False)
+        return 0
+
+    if args.format == "json":
+        # Whole contracts per fund, keyed by the expiry symbol orders go to today
+        orders = route_orders(metrics_frame["target_trade"], futures_prices, fund_config)
+        symbols = contract_symbols(date.today())
+        output = json.dumps({
+            "fx_rates": fx_rates,
+            "futures_prices": futures_prices,
+            "funds": metrics_frame.to_dict("index"),
+            "orders": {
+                fund_code: {symbols[contract]: int(row[contract]) for contract in symbols.index if row[contract]}
+                for fund_code, row in orders.iterrows()
+            },
+        }, indent=2)
+    else:
+        output = export_to_tsv(metrics_frame.to_dict("index"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
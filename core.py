@@ -0,0 +1,1219 @@
+"""Fund tracker core: fetch, parse, compute and export rebalance trades
+
+Everything here runs without Streamlit. Hello.py renders it as a dashboard
+and cli.py runs it headless; both report problems through the on_warning /
+on_error callbacks, which default to logging.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from diagnostics import diagnostics
+from http_client import http_get, retries_used
+
+try:
+    import fcntl
+except ImportError:  # Windows: rate limit is shared within one process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+CACHE_DIR = os.environ.get(
+    "FUND_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "portfolio")
+)
+CACHE_FRESH_SECONDS = 15 * 60            # Serve from disk without revalidating
+CACHE_MAX_AGE_SECONDS = 120 * 24 * 3600  # Evict entries older than ~4 months
+CACHE_MAX_BYTES = 256 * 1024 * 1024      # Evict least recently used beyond this
+
+def _to_columnar(df: pd.DataFrame) -> pd.DataFrame:
+    """Make a parsed sheet safe to write as Parquet (string names, no mixed object columns)"""
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+class FundFileCache:
+    """On-disk cache of parsed monthly portfolio files
+
+    Each entry lives in its own directory keyed by fund code and YearMonth and
+    holds the positions and fund summary as Parquet plus a small meta.json with
+    the NAV and the ETag/Last-Modified validators from the issuer's server.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, max_age_seconds: float):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+    
+    def _entry_dir(self, fund_code: str, year_month: str) -> str:
+        return os.path.join(self.cache_dir, f"{fund_code}_{year_month}")
+    
+    def load(self, fund_code: str, year_month: str) -> Optional[Dict]:
+        """Return the cached entry, or None on a miss or unreadable entry"""
+        entry_dir = self._entry_dir(fund_code, year_month)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # pyarrow directly: pd.read_parquet adds ~1 ms of overhead per small file
+            positions = to_positions(pq.read_table(os.path.join(entry_dir, "positions.parquet")).to_pandas())
+            fund_data = pq.read_table(os.path.join(entry_dir, "fund.parquet")).to_pandas()
+            os.utime(meta_path)  # Record access for LRU eviction
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Unreadable cache entry {fund_code}_{year_month}: {e}")
+            return None
+        return {"positions": positions, "fund_data": fund_data, "nav": meta["nav"], "meta": meta}
+    
+    def store(self, fund_code: str, year_month: str, positions: pd.DataFrame,
+              fund_data: pd.DataFrame, nav: float, headers) -> None:
+        """Write an entry atomically, then enforce the size and age limits"""
+        entry_dir = self._entry_dir(fund_code, year_month)
+        tmp_dir = f"{entry_dir}.tmp{threading.get_ident()}"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            _to_columnar(positions).to_parquet(os.path.join(tmp_dir, "positions.parquet"), index=False)
+            _to_columnar(fund_data).to_parquet(os.path.join(tmp_dir, "fund.parquet"), index=False)
+            meta = {
+                "nav": float(nav),
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            with self._lock:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(tmp_dir, entry_dir)
+        except Exception as e:
+            # Caching is best effort; a failed write just means a miss next time
+            logger.warning(f"Could not cache {fund_code}_{year_month}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+    
+    def mark_revalidated(self, fund_code: str, year_month: str) -> None:
+        """Reset an entry's age after the server confirmed it is unchanged"""
+        meta_path = os.path.join(self._entry_dir(fund_code, year_month), "meta.json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            meta["fetched_at"] = time.time()
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+        except Exception as e:
+            logger.warning(f"Could not update cache entry {fund_code}_{year_month}: {e}")
+    
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+    
+    def evict(self) -> None:
+        """Drop entries past the age limit, then least recently used ones beyond the size limit"""
+        with self._lock:
+            if not os.path.isdir(self.cache_dir):
+                return
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                entry_dir = os.path.join(self.cache_dir, name)
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, "meta.json"))
+                    size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                except OSError:
+                    continue
+                if now - last_used > self.max_age_seconds:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                else:
+                    entries.append((last_used, size, entry_dir))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+
+fund_cache = FundFileCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE_SECONDS)
+
+# Rate limiting helper
+class RateLimiter:
+    """Token-bucket rate limiter, safe across threads, sessions and processes
+
+    The bucket holds up to max_calls_per_minute tokens and refills
+    continuously, so each check is constant time. With a state_path the
+    token count lives in a small file guarded by an flock, which lets every
+    Streamlit worker process draw from the same budget; without one (or on
+    platforms without fcntl, or when the file can't be created) the budget
+    is shared within this process only.
+    """
+    _STATE = struct.Struct("dd")  # tokens, last refill time
+    
+    def __init__(self, max_calls_per_minute=60, state_path: Optional[str] = None):
+        self.capacity = float(max_calls_per_minute)
+        self.refill_rate = max_calls_per_minute / 60.0  # tokens per second
+        self.state_path = state_path if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._state_dir_made = False
+    
+    def _update(self, consume: bool) -> float:
+        """Refill, optionally take a token, and return the seconds until one is available"""
+        with self._lock:
+            if self.state_path:
+                try:
+                    return self._update_shared(consume)
+                except OSError as e:
+                    logger.warning(f"Rate limit state {self.state_path} unavailable, "
+                                   f"limiting this process only: {e}")
+                    self.state_path = None
+            self._tokens, self._updated, wait = self._refill(self._tokens, self._updated, consume)
+            return wait
+    
+    def _update_shared(self, consume: bool) -> float:
+        """_update against the state file; the caller holds the thread lock"""
+        if not self._state_dir_made:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            self._state_dir_made = True
+        with open(self.state_path, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read(self._STATE.size)
+                tokens, updated = (self._STATE.unpack(raw) if len(raw) == self._STATE.size
+                                   else (self.capacity, time.time()))
+                tokens, updated, wait = self._refill(tokens, updated, consume)
+                f.seek(0)
+                f.truncate()
+                f.write(self._STATE.pack(tokens, updated))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+    
+    def _refill(self, tokens: float, updated: float, consume: bool) -> Tuple[float, float, float]:
+        now = time.time()
+        tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.refill_rate)
+        if tokens >= 1:
+            if consume:
+                tokens -= 1
+            return tokens, now, 0.0
+        return tokens, now, (1 - tokens) / self.refill_rate
+    
+    def can_call(self) -> bool:
+        """Whether a token is available right now, without taking it"""
+        return self._update(consume=False) == 0
+    
+    def try_acquire(self) -> bool:
+        """Take a token if one is available, without waiting"""
+        return self._update(consume=True) == 0
+    
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Take a token, waiting up to timeout seconds for one to free up"""
+        deadline = time.time() + timeout
+        while True:
+            wait = self._update(consume=True)
+            if wait == 0:
+                return True
+            if time.time() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+# Global rate limiter - much more conservative, shared by every session and worker process
+RATE_LIMIT_STATE = os.path.join(os.path.dirname(CACHE_DIR), "yfinance_rate_limit.bin")
+RATE_LIMIT_WAIT = 5.0  # Seconds a quote lookup may queue for a token
+
+rate_limiter = RateLimiter(max_calls_per_minute=10, state_path=RATE_LIMIT_STATE)
+
+class QuoteStore:
+    """Last-known-good quotes and their history in a small SQLite database
+
+    Every successful download is recorded, so a process that restarts, or
+    whose quote source is down or rate limited, starts from the last good
+    price and when it was fetched rather than from a made-up constant. WAL
+    mode lets the dashboards and the snapshot worker share one file.
+    
+    The database is created on first use; if that fails (e.g. a read-only
+    cache directory) quotes simply aren't persisted.
+    """
+    def __init__(self, path: str, history_days: float = 30):
+        self.path = path
+        self.history_days = history_days
+        self._lock = threading.Lock()
+        self._ready: Optional[bool] = None  # None until first use, False if the database can't be created
+    
+    def _available(self) -> bool:
+        """Create the database and its tables on first use"""
+        with self._lock:
+            if self._ready is None:
+                try:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    with closing(self._connect()) as conn, conn:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.execute("CREATE TABLE IF NOT EXISTS latest "
+                                     "(symbol TEXT PRIMARY KEY, price REAL NOT NULL, fetched_at REAL NOT NULL)")
+                        conn.execute("CREATE TABLE IF NOT EXISTS history "
+                                     "(symbol TEXT NOT NULL, price REAL NOT NULL, fetched_at REAL NOT NULL)")
+                        conn.execute("CREATE INDEX IF NOT EXISTS history_by_time ON history (symbol, fetched_at)")
+                    self._ready = True
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"Quote store {self.path} unavailable, quotes will not be persisted: {e}")
+                    self._ready = False
+            return self._ready
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable enough for a cache, no fsync per write
+        return conn
+    
+    def record(self, quotes: Dict[str, float], fetched_at: float) -> None:
+        """Store a download as the latest quotes and append it to the history"""
+        if not self._available():
+            return
+        rows = [(symbol, price, fetched_at) for symbol, price in quotes.items()]
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.executemany("INSERT OR REPLACE INTO latest VALUES (?, ?, ?)", rows)
+                conn.executemany("INSERT INTO history VALUES (?, ?, ?)", rows)
+                conn.execute("DELETE FROM history WHERE fetched_at < ?", (fetched_at - self.history_days * 86400,))
+        except sqlite3.Error as e:
+            # Losing the persisted copy must not cost the live quotes
+            logger.warning(f"Could not store quotes in {self.path}: {e}")
+    
+    def latest(self, symbols: Tuple[str, ...]) -> Dict[str, Tuple[float, float]]:
+        """Symbol -> (last good price, fetched_at) for the stored symbols among symbols"""
+        if not self._available():
+            return {}
+        try:
+            with closing(self._connect()) as conn:
+                rows = conn.execute(
+                    f"SELECT symbol, price, fetched_at FROM latest WHERE symbol IN ({','.join('?' * len(symbols))})",
+                    tuple(symbols),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read stored quotes from {self.path}: {e}")
+            return {}
+        return {symbol: (price, fetched_at) for symbol, price, fetched_at in rows}
+    
+    def history(self, symbol: str, since: float = 0.0) -> pd.DataFrame:
+        """Stored prices of one symbol since a timestamp, indexed by fetch time"""
+        rows = []
+        if self._available():
+            with closing(self._connect()) as conn:
+                rows = conn.execute("SELECT fetched_at, price FROM history WHERE symbol = ? AND fetched_at >= ? "
+                                    "ORDER BY fetched_at", (symbol, since)).fetchall()
+        frame = pd.DataFrame(rows, columns=["fetched_at", "price"])
+        return frame.set_index(pd.to_datetime(frame.pop("fetched_at"), unit="s").rename("time"))
+
+QUOTE_DB = os.path.join(os.path.dirname(CACHE_DIR), "quotes.sqlite")
+quote_store = QuoteStore(QUOTE_DB)  # Opened on first use
+
+# Fund registry: one row per fund with its issuer file, underlying future,
+# contract multiplier, leverage, currency, FX pair and sane price bands.
+# Adding a fund (or an issuer) is a new row in funds.csv.
+FUND_REGISTRY_PATH = os.environ.get(
+    "FUND_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "funds.csv")
+)
+REGISTRY_DTYPES = {
+    "fund_code": str, "issuer": str, "url_template": str, "underlying": str,
+    "future_symbol": str, "proxy_symbol": str, "proxy_factor": float,
+    "multiplier": float, "leverage": float, "currency": str, "fx_symbol": str,
+    "price_min": float, "price_max": float, "default_price": float,
+    "fx_min": float, "fx_max": float, "default_fx": float,
+}
+UNDERLYING_COLUMNS = ["future_symbol", "proxy_symbol", "proxy_factor", "price_min", "price_max", "default_price"]
+CURRENCY_COLUMNS = ["fx_symbol", "fx_min", "fx_max", "default_fx"]
+
+def _by_key(registry: pd.DataFrame, key: str, columns: List[str]) -> pd.DataFrame:
+    """One row per underlying / currency; funds sharing one must agree on its settings"""
+    table = registry[[key] + columns].drop_duplicates()
+    conflicts = table[key][table[key].duplicated()].unique()
+    if len(conflicts):
+        raise ValueError(f"Fund registry has conflicting {key} settings for: {', '.join(conflicts)}")
+    return table.set_index(key)
+
+def load_fund_registry(path: str = FUND_REGISTRY_PATH) -> pd.DataFrame:
+    """Read and validate the fund registry, indexed by fund code"""
+    registry = pd.read_csv(path, dtype=REGISTRY_DTYPES, keep_default_na=False, na_values={
+        column: [""] for column, dtype in REGISTRY_DTYPES.items() if dtype is float
+    })
+    missing = set(REGISTRY_DTYPES) - set(registry.columns)
+    if missing:
+        raise ValueError(f"Fund registry {path} is missing columns: {', '.join(sorted(missing))}")
+    duplicated = registry["fund_code"][registry["fund_code"].duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(f"Fund registry {path} lists funds more than once: {', '.join(duplicated)}")
+    registry["proxy_factor"] = registry["proxy_factor"].fillna(1.0)
+    _by_key(registry, "underlying", UNDERLYING_COLUMNS)
+    _by_key(registry, "currency", CURRENCY_COLUMNS)
+    return registry.set_index("fund_code")
+
+# Loaded once at import; lookups go through the fund_code index
+FUND_CONFIG = load_fund_registry()
+FUND_CODES = list(FUND_CONFIG.index)
+UNDERLYINGS = _by_key(FUND_CONFIG, "underlying", UNDERLYING_COLUMNS)
+CURRENCIES = _by_key(FUND_CONFIG, "currency", CURRENCY_COLUMNS)
+
+# Overrides every fund's url_template, e.g. to point at a mirror or test server
+PORTFOLIO_URL = os.environ.get("FUND_PORTFOLIO_URL")
+
+def portfolio_url(fund_code: str, year_month: str) -> str:
+    """Monthly portfolio file location for a fund"""
+    template = PORTFOLIO_URL
+    if template is None:
+        if fund_code not in FUND_CONFIG.index:
+            raise KeyError(f"Fund {fund_code} is not in the fund registry")
+        template = FUND_CONFIG.at[fund_code, "url_template"]
+    return template.format(fund_code=fund_code, year_month=year_month)
+
+# Fetch timeouts (seconds) and concurrent fund downloads
+FUND_FETCH_TIMEOUT = 30
+MAX_FETCH_WORKERS = 16
+QUOTE_FETCH_TIMEOUT = 15
+
+# Market symbols resolved in one batched download, and how often the poller refreshes them
+QUOTE_SYMBOLS = tuple(dict.fromkeys(
+    symbol
+    for column in ("fx_symbol", "future_symbol", "proxy_symbol")
+    for symbol in FUND_CONFIG[column]
+    if symbol
+))
+POLL_INTERVAL = 15  # seconds
+QUOTE_STALE_SECONDS = 4 * POLL_INTERVAL  # Older quotes are flagged as stale
+
+class RateLimitExceeded(RuntimeError):
+    pass
+
+def download_quotes(symbols: Tuple[str, ...]) -> Dict[str, float]:
+    """Latest price for every symbol from one batched yfinance download"""
+    with diagnostics.timed("quotes", source="yfinance.download") as timing:
+        wait_start = time.perf_counter()
+        if not rate_limiter.acquire(timeout=RATE_LIMIT_WAIT):
+            raise RateLimitExceeded("Rate limit reached")
+        timing["rate_limit_wait"] = time.perf_counter() - wait_start
+        
+        import yfinance as yf
+        # Today's bars are enough while markets trade; over a weekend or holiday
+        # the last close is further back
+        for period in ("1d", "5d"):
+            data = yf.download(list(symbols), period=period, interval="1m", progress=False,
+                               threads=False, auto_adjust=False)
+            if data is not None and not data.empty:
+                break
+        timing["period"] = period
+        if data is None or data.empty:
+            raise RuntimeError(f"No quote data returned for {', '.join(symbols)}")
+        
+        close = data["Close"]
+        if isinstance(close, pd.Series):
+            close = close.to_frame(symbols[0])
+        
+        quotes = {}
+        for symbol in symbols:
+            if symbol not in close:
+                continue
+            prices = close[symbol].dropna()
+            if not prices.empty and prices.iloc[-1] > 0:
+                quotes[symbol] = float(prices.iloc[-1])
+        
+        if not quotes:
+            raise RuntimeError(f"No valid quotes for {', '.join(symbols)}")
+        timing["symbols"] = len(quotes)
+        quote_store.record(quotes, time.time())
+        return quotes
+
+# Market snapshots, as served by MarketDataPoller and the snapshot worker:
+# quotes and quote_times (epoch seconds) per symbol, updated (last successful
+# download), error and rate_limited (why the last refresh failed, if it did)
+
+def stored_market_snapshot(symbols: Tuple[str, ...]) -> Dict:
+    """Snapshot of the last-known-good quotes in the quote store"""
+    latest = quote_store.latest(symbols)
+    quote_times = {symbol: fetched_at for symbol, (_, fetched_at) in latest.items()}
+    return {
+        "quotes": {symbol: price for symbol, (price, _) in latest.items()},
+        "quote_times": quote_times,
+        "updated": datetime.fromtimestamp(max(quote_times.values())) if quote_times else None,
+        "error": None,
+        "rate_limited": False,
+    }
+
+def refreshed_market_snapshot(snapshot: Dict, quotes: Dict[str, float]) -> Dict:
+    """A fresh download over the previous snapshot; symbols it missed keep their last good quote"""
+    now = datetime.now()
+    return {
+        "quotes": {**snapshot["quotes"], **quotes},
+        "quote_times": {**snapshot["quote_times"], **dict.fromkeys(quotes, now.timestamp())},
+        "updated": now,
+        "error": None,
+        "rate_limited": False,
+    }
+
+def failed_market_snapshot(snapshot: Dict, error: Exception) -> Dict:
+    """The previous snapshot, still served, with the failure noted"""
+    return {**snapshot, "error": str(error), "rate_limited": isinstance(error, RateLimitExceeded)}
+
+def stale_quotes(snapshot: Dict, max_age: float = QUOTE_STALE_SECONDS) -> Dict[str, float]:
+    """Symbol -> age in seconds of every quote older than max_age"""
+    now = time.time()
+    return {symbol: now - fetched_at for symbol, fetched_at in snapshot["quote_times"].items()
+            if now - fetched_at > max_age}
+
+class MarketDataPoller:
+    """Background thread that refreshes market quotes into a shared snapshot
+
+    One poller serves every session in the process, so the upstream load is
+    one batched download per interval regardless of how many pages are open.
+    Pages read the latest snapshot without touching the network. It starts
+    from the quote store's last-known-good quotes, so pages only wait for the
+    first download when nothing has ever been stored.
+    """
+    def __init__(self, symbols: Tuple[str, ...], interval: float):
+        self.symbols = symbols
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._snapshot = stored_market_snapshot(symbols)
+        self._first_refresh = threading.Event()
+        if self._snapshot["quotes"]:
+            self._first_refresh.set()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="market-data-poller", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+    
+    def refresh(self):
+        try:
+            quotes = download_quotes(self.symbols)
+            with self._lock:
+                self._snapshot = refreshed_market_snapshot(self._snapshot, quotes)
+        except Exception as e:
+            # Keep serving the last good quotes; just record why the refresh failed
+            with self._lock:
+                self._snapshot = failed_market_snapshot(self._snapshot, e)
+        finally:
+            self._first_refresh.set()
+    
+    def refresh_now(self):
+        """Wake the poller for an immediate refresh"""
+        self._wake.set()
+    
+    def snapshot(self, timeout: float = 0.0) -> Dict:
+        """Latest quotes; waits up to timeout only if the first refresh hasn't finished"""
+        self._first_refresh.wait(timeout)
+        with self._lock:
+            return dict(self._snapshot)
+
+def get_fx_rate(quotes: Dict[str, float], on_warning: Callable[[str], None] = logger.warning,
+                currency: Optional[str] = None) -> float:
+    """Get the JPY rate for a fund currency (default: the first registered) from the batched quotes
+
+    NaN if there is no plausible quote.
+    """
+    currency = currency or CURRENCIES.index[0]
+    config = CURRENCIES.loc[currency]
+    fx_rate = quotes.get(config["fx_symbol"])
+    if fx_rate and config["fx_min"] < fx_rate < config["fx_max"]:  # Reasonable JPY range
+        diagnostics.record("fx_quote", source=config["fx_symbol"])
+        return fx_rate
+    
+    # No made-up rate: the caller must not size trades without one
+    diagnostics.record("fx_quote", source="missing")
+    on_warning(f"No valid {currency}/JPY quote. Enter the rate manually to size trades.")
+    return float("nan")
+
+def get_futures_price(quotes: Dict[str, float], on_warning: Callable[[str], None] = logger.warning,
+                      underlying: Optional[str] = None) -> float:
+    """Get the live futures price for an underlying (default: the first registered) from the batched quotes
+
+    NaN if there is no plausible quote.
+    """
+    underlying = underlying or UNDERLYINGS.index[0]
+    config = UNDERLYINGS.loc[underlying]
+    
+    # The future itself first, then its proxy (e.g. an ETF) scaled to futures points
+    symbols_to_try = [(config["future_symbol"], 1.0)]
+    if config["proxy_symbol"]:
+        symbols_to_try.append((config["proxy_symbol"], config["proxy_factor"]))
+    
+    for symbol, factor in symbols_to_try:
+        price = quotes.get(symbol)
+        if price and price > 0:
+            price = price * factor
+            # Validate price range
+            if config["price_min"] < price < config["price_max"]:
+                diagnostics.record("futures_quote", source=symbol)
+                return price
+    
+    # No made-up price: the caller must not size trades without one
+    diagnostics.record("futures_quote", source="missing")
+    on_warning(f"No valid {underlying} futures quote. Enter the price manually to size trades.")
+    return float("nan")
+
+def get_live_prices(quotes: Dict[str, float], on_warning: Callable[[str], None] = logger.warning,
+                    fund_config: pd.DataFrame = FUND_CONFIG) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """JPY rate per currency and futures price per underlying for the given funds (NaN where unquoted)"""
+    fx_rates = {currency: get_fx_rate(quotes, on_warning, currency)
+                for currency in fund_config["currency"].unique()}
+    futures_prices = {underlying: get_futures_price(quotes, on_warning, underlying)
+                      for underlying in fund_config["underlying"].unique()}
+    return fx_rates, futures_prices
+
+# Typed position schema: the holding's identifiers and quantity, and the
+# columns the metrics read, with their dtypes. Parsing, the cache and the
+# archive all hold positions in this shape.
+POSITION_SCHEMA = {
+    "Code": "str",
+    "Name": "str",
+    "Category": "category",
+    "Currency": "category",
+    "Quantity": "float64",
+    "Price": "float64",
+    "Value(Local)": "float64",
+    "Value(JPY)": "float64",
+}
+LABEL_POSITION_COLUMNS = [column for column, dtype in POSITION_SCHEMA.items() if dtype in ("str", "category")]
+NUMERIC_POSITION_COLUMNS = [column for column, dtype in POSITION_SCHEMA.items() if dtype == "float64"]
+# The same schema as Arrow fields, for the archive, snapshot and export files
+POSITION_ARROW_FIELDS = [
+    (column, {"str": pa.string(), "category": pa.dictionary(pa.int32(), pa.string())}.get(dtype, pa.float64()))
+    for column, dtype in POSITION_SCHEMA.items()
+]
+# Every sheet must have these; the others are left blank where an issuer leaves them out
+REQUIRED_POSITION_COLUMNS = ["Category", "Price", "Value(Local)", "Value(JPY)"]
+
+class PositionSchemaError(ValueError):
+    pass
+
+def empty_positions() -> pd.DataFrame:
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in POSITION_SCHEMA.items()})
+
+def _label_column(labels: List[Optional[str]]) -> pd.Categorical:
+    """Categorical of labels (None for blank), coded directly: pd.Categorical(labels) is ~3x slower"""
+    categories = {}
+    codes = [-1 if label is None else categories.setdefault(label, len(categories)) for label in labels]
+    return pd.Categorical.from_codes(codes, categories=pd.Index(list(categories), dtype="str"), validate=False)
+
+def _position_label(value) -> Optional[str]:
+    if isinstance(value, str):
+        return value.strip() or None
+    if value is None or value != value:
+        return None
+    # Numeric codes come out of Excel as floats: 7203.0 is security code 7203
+    return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+
+def to_positions(raw) -> pd.DataFrame:
+    """Typed, validated position frame from a DataFrame or dict of raw columns
+
+    Blank rows (no category and no numbers) are dropped and stray text in
+    numeric columns becomes NaN, except on futures rows, which feed the
+    metrics and must be numeric. Columns outside REQUIRED_POSITION_COLUMNS
+    may be missing, e.g. in cache entries from before they were kept, and
+    come back blank.
+    """
+    missing = [column for column in REQUIRED_POSITION_COLUMNS if column not in raw]
+    if missing:
+        raise PositionSchemaError(f"Position sheet is missing columns: {', '.join(missing)}")
+    if isinstance(raw, pd.DataFrame) and all(column in raw and str(raw[column].dtype) == dtype
+                                             for column, dtype in POSITION_SCHEMA.items()):
+        # Already typed, e.g. read back from the cache
+        return raw if list(raw.columns) == list(POSITION_SCHEMA) else raw[list(POSITION_SCHEMA)]
+    
+    rows = len(raw["Category"])
+    columns = {}
+    for column in LABEL_POSITION_COLUMNS:
+        labels = [_position_label(value) for value in raw[column]] if column in raw else [None] * rows
+        if POSITION_SCHEMA[column] == "category":
+            columns[column] = _label_column(labels)
+        else:
+            columns[column] = pd.array(labels, dtype="str")
+    is_future = np.asarray(columns["Category"] == "Future")
+    for column in NUMERIC_POSITION_COLUMNS:
+        if column not in raw:
+            columns[column] = np.full(rows, np.nan)
+            continue
+        values = raw[column]
+        try:
+            columns[column] = np.asarray(values, dtype="float64")
+        except (TypeError, ValueError):
+            # Text among the numbers: blank it, unless it sits on a futures row
+            values = pd.Series(np.asarray(values, dtype=object))
+            numeric = pd.to_numeric(values, errors="coerce").to_numpy(dtype="float64")
+            bad = is_future & np.isnan(numeric) & values.notna().to_numpy()
+            if bad.any():
+                raise PositionSchemaError(f"Non-numeric {column} on futures row(s): "
+                                          f"{', '.join(map(str, values[bad].head(3)))}")
+            columns[column] = numeric
+    
+    blank = np.asarray(columns["Category"].isna())
+    for column in NUMERIC_POSITION_COLUMNS:
+        blank &= np.isnan(columns[column])
+    frame = pd.DataFrame({column: columns[column] for column in POSITION_SCHEMA})
+    return frame[~blank].reset_index(drop=True) if blank.any() else frame
+
+# Labels the summary block may give the fund's net assets under, compared
+# after lower-casing and dropping footnote marks such as "*1"
+NAV_LABELS = ("aum", "net assets", "total net assets", "純資産総額")
+LAYOUT_SCAN_ROWS = 200  # The position header must start within this many rows
+
+class WorkbookLayoutError(ValueError):
+    pass
+
+def _is_blank(value) -> bool:
+    return value is None or value == "" or value != value
+
+def _label(value) -> Optional[str]:
+    """Normalised text of a label cell, or None for anything that isn't text"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return re.sub(r"\s*\*\d*$", "", value.strip()).casefold()
+
+class _XlsCells:
+    """Cells of an .xls sheet, converted from xlrd's raw arrays as rows or column slices are asked for"""
+    def __init__(self, contents: bytes):
+        import xlrd  # Only needed on a cache miss
+        with open(os.devnull, 'w') as devnull:
+            self._book = xlrd.open_workbook(file_contents=contents, logfile=devnull, on_demand=True)
+            # on_demand: the sheet is only parsed here, and may still log warnings
+            self._sheet = self._book.sheet_by_index(0)
+        self.nrows = self._sheet.nrows
+
+    def _convert(self, values: list, types: list) -> list:
+        import xlrd
+        return [np.nan if ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR)
+                else xlrd.xldate.xldate_as_datetime(value, self._book.datemode) if ctype == xlrd.XL_CELL_DATE
+                else bool(value) if ctype == xlrd.XL_CELL_BOOLEAN
+                else value
+                for value, ctype in zip(values, types)]
+
+    def row(self, r: int) -> list:
+        return self._convert(self._sheet.row_values(r), self._sheet.row_types(r))
+
+    def column(self, j: int, start: int, end: int) -> list:
+        return self._convert(self._sheet.col_values(j, start, end), self._sheet.col_types(j, start, end))
+
+    def close(self):
+        self._book.release_resources()
+
+class _XlsxCells:
+    """Cells of an .xlsx sheet, read once as rows of values"""
+    def __init__(self, contents: bytes):
+        import io
+        import openpyxl  # Only needed for .xlsx issuers
+        book = openpyxl.load_workbook(io.BytesIO(contents), read_only=True, data_only=True)
+        try:
+            self._rows = [[np.nan if value is None else value for value in row]
+                          for row in book.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            book.close()
+        self.nrows = len(self._rows)
+
+    def row(self, r: int) -> list:
+        return self._rows[r]
+
+    def column(self, j: int, start: int, end: int) -> list:
+        return [row[j] if j < len(row) else np.nan for row in self._rows[start:end]]
+
+    def close(self):
+        pass
+
+def _open_cells(contents: bytes):
+    if contents[:4] == b"PK\x03\x04":
+        return _XlsxCells(contents)
+    if contents[:8] == b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1":
+        return _XlsCells(contents)
+    raise WorkbookLayoutError("Not an .xls or .xlsx workbook")
+
+def _summary_cells(row: list) -> Optional[Tuple[int, int]]:
+    """(label column, value column) of a summary row: its first text cell and the next filled one"""
+    for j, value in enumerate(row):
+        if _label(value) is not None:
+            for k in range(j + 1, len(row)):
+                if not _is_blank(row[k]):
+                    return j, k
+            return None
+        if not _is_blank(value):
+            return None
+    return None
+
+def detect_layout(cells) -> Dict:
+    """Find the position table of a sheet by its header
+
+    The header is the first row naming every REQUIRED_POSITION_COLUMNS
+    column; the layout is its row and the column of each POSITION_SCHEMA
+    column it names.
+    """
+    for header_row in range(min(cells.nrows, LAYOUT_SCAN_ROWS)):
+        header = {value.strip(): j for j, value in enumerate(cells.row(header_row))
+                  if isinstance(value, str) and value.strip()}
+        if all(column in header for column in REQUIRED_POSITION_COLUMNS):
+            break
+    else:
+        raise WorkbookLayoutError(f"No position header naming {', '.join(REQUIRED_POSITION_COLUMNS)} "
+                                  f"in the first {LAYOUT_SCAN_ROWS} rows")
+    return {
+        "header_row": header_row,
+        "columns": {column: header[column] for column in POSITION_SCHEMA if column in header},
+    }
+
+def _layout_fits(cells, layout: Dict) -> bool:
+    """Whether a sheet still has the position header where the layout found it"""
+    if cells.nrows <= layout["header_row"]:
+        return False
+    header = cells.row(layout["header_row"])
+    return all(j < len(header) and isinstance(header[j], str) and header[j].strip() == column
+               for column, j in layout["columns"].items())
+
+def _read_summary(cells, header_row: int) -> Tuple[List[str], list, object]:
+    """Labels and values of the summary rows above the position header, and the NAV among them
+
+    Scanned on every parse (it is a few rows), so moved or blank labels
+    never misread a cached position.
+    """
+    labels, values, nav = [], [], None
+    for r in range(header_row):
+        row = cells.row(r)
+        found = _summary_cells(row)
+        if found:
+            label_col, value_col = found
+            labels.append(row[label_col].strip())
+            values.append(row[value_col])
+            if nav is None and _label(row[label_col]) in NAV_LABELS:
+                nav = row[value_col]
+    if nav is None:
+        raise WorkbookLayoutError("No NAV in the summary block (looked for: " + ", ".join(NAV_LABELS) + ")")
+    return labels, values, nav
+
+# Detected layouts per issuer template, so each file after the first is only checked against it
+_layouts: Dict[str, Dict] = {}
+
+def _table_end(cells, layout: Dict) -> int:
+    """One past the last position row: the last row with a number in a numeric column (footers are text)"""
+    start = layout["header_row"] + 1
+    end = start
+    for column in NUMERIC_POSITION_COLUMNS:
+        if column not in layout["columns"]:
+            continue
+        values = cells.column(layout["columns"][column], start, cells.nrows)
+        numeric = [i for i, value in enumerate(values)
+                   if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value]
+        if numeric:
+            end = max(end, start + numeric[-1] + 1)
+    return end
+
+def parse_fund_workbook(contents: bytes, template: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame, float]:
+    """Parse fund summary, positions and NAV from in-memory .xls or .xlsx bytes
+
+    The position table (see detect_layout) is found by its header rather
+    than by fixed offsets, and remembered per template (e.g. the fund's
+    issuer): later files from the same template only confirm the header is
+    still in place, and a template change is detected afresh. The summary
+    above it, with the NAV found by label, is read afresh each time. Positions are
+    read as column slices of just the POSITION_SCHEMA columns, down to the
+    last row with numbers, and typed and validated by to_positions.
+    """
+    cells = _open_cells(contents)
+    try:
+        layout = _layouts.get(template) if template else None
+        if layout is None or not _layout_fits(cells, layout):
+            if layout is not None:
+                logger.info(f"Workbook layout of {template} changed, detecting it again")
+            layout = detect_layout(cells)
+            if template:
+                _layouts[template] = layout
+
+        labels, values, nav = _read_summary(cells, layout["header_row"])
+        fundData = pd.DataFrame([values], columns=labels).infer_objects()
+
+        start, end = layout["header_row"] + 1, _table_end(cells, layout)
+        FundPositions = to_positions({column: cells.column(j, start, end)
+                                      for column, j in layout["columns"].items()})
+    finally:
+        cells.close()
+
+    if not isinstance(nav, (int, float)) or isinstance(nav, bool):
+        raise WorkbookLayoutError(f"NAV is not a number: {nav!r}")
+    return FundPositions, fundData, float(nav)
+
+def download_fund_data(fund_code: str, use_cache: bool = True,
+                       max_cache_age: float = CACHE_FRESH_SECONDS,
+                       on_error: Callable[[str], None] = logger.error,
+                       year_month: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame, float]:
+    """Download and parse fund data with error handling
+
+    With use_cache, an entry younger than max_cache_age is served straight
+    from disk; an older one is revalidated with If-None-Match/If-Modified-Since
+    and only re-downloaded if the issuer has published a new file.
+    year_month (YYYYMM) selects a past monthly file; the default is this month.
+    """
+    try:
+        YearMonth = year_month or date.today().strftime('%Y%m')
+        link = portfolio_url(fund_code, YearMonth)
+        
+        with diagnostics.timed("fetch", fund=fund_code) as fetch:
+            cached = fund_cache.load(fund_code, YearMonth) if use_cache else None
+            if cached and time.time() - cached["meta"]["fetched_at"] < max_cache_age:
+                fetch["cache"] = "hit"
+                return cached["positions"], cached["fund_data"], cached["nav"]
+            fetch["cache"] = "miss" if use_cache else "bypass"
+            
+            headers = {}
+            if cached:
+                if cached["meta"].get("etag"):
+                    headers["If-None-Match"] = cached["meta"]["etag"]
+                if cached["meta"].get("last_modified"):
+                    headers["If-Modified-Since"] = cached["meta"]["last_modified"]
+            
+            # Download file into memory over the shared, pooled session
+            response = http_get(link, headers=headers)
+            fetch["retries"] = retries_used(response)
+            if response.status_code == 304 and cached:
+                fetch["cache"] = "revalidated"
+                fund_cache.mark_revalidated(fund_code, YearMonth)
+                return cached["positions"], cached["fund_data"], cached["nav"]
+            response.raise_for_status()
+            contents = response.content
+            fetch["bytes"] = len(contents)
+        
+        with diagnostics.timed("parse", fund=fund_code, bytes=len(contents)):
+            FundPositions, fundData, nav = parse_fund_workbook(contents, FUND_CONFIG["issuer"].get(fund_code))
+        with diagnostics.timed("cache_store", fund=fund_code):
+            fund_cache.store(fund_code, YearMonth, FundPositions, fundData, nav, response.headers)
+        
+        return FundPositions, fundData, nav
+        
+    except Exception as e:
+        on_error(f"Error downloading data for fund {fund_code}: {str(e)}")
+        return empty_positions(), pd.DataFrame(), 0.0
+
+async def _run_blocking(executor: ThreadPoolExecutor, func: Callable, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args))
+
+def _last_cached_fund_data(fund_code: str,
+                           on_warning: Callable[[str], None]) -> Tuple[pd.DataFrame, pd.DataFrame, float]:
+    """This month's cached file however old, else an empty fund"""
+    cached = fund_cache.load(fund_code, date.today().strftime('%Y%m'))
+    if not cached:
+        return empty_positions(), pd.DataFrame(), 0.0
+    fetched_at = datetime.fromtimestamp(cached["meta"]["fetched_at"])
+    on_warning(f"Showing fund {fund_code} as fetched at {fetched_at:%Y-%m-%d %H:%M}")
+    return cached["positions"], cached["fund_data"], cached["nav"]
+
+async def fetch_fund_async(fund_code: str, executor: ThreadPoolExecutor,
+                           deadline: Optional[float] = None, use_cache: bool = True,
+                           max_cache_age: float = CACHE_FRESH_SECONDS,
+                           on_error: Callable[[str], None] = logger.error,
+                           on_warning: Callable[[str], None] = logger.warning,
+                           ) -> Tuple[pd.DataFrame, pd.DataFrame, float]:
+    """One fund file, downloaded and parsed on an executor thread and awaited up to deadline seconds
+
+    A download that fails or misses its deadline falls back to the last
+    cached copy of the file (with use_cache), so one stalled issuer server
+    costs that fund its freshness rather than the page its data. deadline
+    defaults to FUND_FETCH_TIMEOUT.
+    """
+    deadline = FUND_FETCH_TIMEOUT if deadline is None else deadline
+    try:
+        result = await asyncio.wait_for(
+            _run_blocking(executor, download_fund_data, fund_code, use_cache, max_cache_age, on_error), deadline
+        )
+    except asyncio.TimeoutError:
+        on_error(f"Timed out downloading data for fund {fund_code}")
+        result = (empty_positions(), pd.DataFrame(), 0.0)
+    if result[2] > 0 or not use_cache:
+        return result
+    return _last_cached_fund_data(fund_code, on_warning)
+
+async def fetch_quotes_async(symbols: Tuple[str, ...], executor: ThreadPoolExecutor,
+                             deadline: Optional[float] = None) -> Dict[str, float]:
+    """download_quotes on an executor thread; raises TimeoutError past deadline (QUOTE_FETCH_TIMEOUT)"""
+    deadline = QUOTE_FETCH_TIMEOUT if deadline is None else deadline
+    return await asyncio.wait_for(_run_blocking(executor, download_quotes, tuple(symbols)), deadline)
+
+async def gather_market_data(fund_codes: List[str], symbols: Tuple[str, ...] = QUOTE_SYMBOLS,
+                             use_cache: bool = True, max_cache_age: float = CACHE_FRESH_SECONDS,
+                             fund_deadline: Optional[float] = None,
+                             quote_deadline: Optional[float] = None,
+                             on_error: Callable[[str], None] = logger.error,
+                             on_warning: Callable[[str], None] = logger.warning,
+                             initializer: Optional[Callable[[], None]] = None) -> Tuple[Dict, Dict[str, float]]:
+    """Every fund file and the quotes in one gather, each under its own deadline
+
+    Returns (fund_downloads, quotes). Wall-clock time is bounded by the
+    slowest source or its deadline, whichever comes first; failed or late
+    quotes come back empty with a warning. The blocking HTTP session, xlrd
+    and yfinance run on executor threads; initializer runs in each, e.g. to
+    attach the Streamlit script context. A thread still stuck on a stalled
+    server when its deadline passes is abandoned and ends on its HTTP timeout.
+    """
+    executor = ThreadPoolExecutor(max_workers=min(len(fund_codes), MAX_FETCH_WORKERS) + 1,
+                                  initializer=initializer)
+
+    async def quotes() -> Dict[str, float]:
+        if not symbols:
+            return {}
+        try:
+            return await fetch_quotes_async(symbols, executor, quote_deadline)
+        except asyncio.TimeoutError:
+            on_warning("Timed out downloading quotes")
+        except Exception as e:
+            on_warning(f"Quote download failed: {e}")
+        return {}
+
+    try:
+        *fund_results, quote_results = await asyncio.gather(
+            *(fetch_fund_async(code, executor, fund_deadline, use_cache, max_cache_age, on_error, on_warning)
+              for code in fund_codes),
+            quotes(),
+        )
+        return dict(zip(fund_codes, fund_results)), quote_results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def fetch_market_data(fund_codes: List[str], symbols: Tuple[str, ...] = QUOTE_SYMBOLS,
+                      **kwargs) -> Tuple[Dict, Dict[str, float]]:
+    """Blocking entry point to gather_market_data, for scripts without an event loop"""
+    # Not asyncio.run: on the main thread its SIGINT handler setup reprs the
+    # pending task, frames and all, which costs more than the warm fetch itself
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(gather_market_data(fund_codes, symbols, **kwargs))
+    finally:
+        loop.close()
+
+def fetch_all_data(fund_codes: List[str], use_cache: bool = True,
+                   max_cache_age: float = CACHE_FRESH_SECONDS,
+                   on_error: Callable[[str], None] = logger.error,
+                   initializer: Optional[Callable[[], None]] = None,
+                   on_warning: Callable[[str], None] = logger.warning) -> Dict:
+    """Download all fund files concurrently; gather_market_data without quotes"""
+    fund_downloads, _ = fetch_market_data(fund_codes, (), use_cache=use_cache, max_cache_age=max_cache_age,
+                                          on_error=on_error, on_warning=on_warning, initializer=initializer)
+    return fund_downloads
+
+METRIC_COLUMNS = ['cur_fut_position', 'target_position', 'target_trade',
+                  'live_fund_weight', 'prev_inv_ratio', 'fut_pct_change']
+
+def aggregate_futures(positions: pd.DataFrame, fund_index: pd.Index) -> pd.DataFrame:
+    """Total local/JPY value and average price of futures positions per fund"""
+    fut_positions = positions[positions.Category == "Future"]
+    return fut_positions.groupby('fund_code', sort=False).agg(
+        value_local=('Value(Local)', 'sum'),
+        avg_price=('Price', 'mean'),
+        value_jpy=('Value(JPY)', 'sum'),
+    ).reindex(fund_index)
+
+def rebalance_formulas(lev_ratio, multiplier, nav, cf_factor, fx_rate, futures_price,
+                       value_local, avg_price, value_jpy) -> Dict[str, np.ndarray]:
+    """The rebalance metrics from per-fund futures aggregates
+
+    Works element-wise on scalars or any broadcastable arrays, so the batch
+    engine, the scenario grid, the history and the incremental graph all
+    share one set of formulas. Zero denominators give 0, not inf/NaN;
+    funds without futures (NaN avg_price) are left NaN for the caller.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cur_fut_position = value_local / multiplier / avg_price
+        fut_pct_change = futures_price / avg_price - 1
+        target_position = (lev_ratio * nav * (1 + lev_ratio * fut_pct_change) /
+                           (fx_rate * multiplier * futures_price) * cf_factor)
+        target_trade = target_position - cur_fut_position
+        live_fund_weight = np.where(target_position != 0,
+                                    cur_fut_position / target_position * lev_ratio, 0)
+        prev_inv_ratio = np.where(nav != 0, value_jpy / nav, 0)
+    return {
+        'cur_fut_position': cur_fut_position,
+        'target_position': target_position,
+        'target_trade': target_trade,
+        'live_fund_weight': live_fund_weight,
+        'prev_inv_ratio': prev_inv_ratio,
+        'fut_pct_change': fut_pct_change,
+    }
+
+def calculate_fund_metrics_batch(funds: pd.DataFrame, positions: pd.DataFrame,
+                                 fx_rates: Dict[str, float], futures_price,
+                                 on_error: Callable[[str], None] = logger.error) -> pd.DataFrame:
+    """Calculate metrics for every fund in one vectorized pass
+
+    funds: one row per fund code (index) with leverage, multiplier, currency,
+        nav and cf_factor columns
+    positions: position sheets of all funds stacked, with a fund_code column
+    fx_rates: JPY rate per fund currency
+    futures_price: live futures price, a scalar or a Series indexed by fund code
+
+    Funds without futures positions get zeros, as does any metric whose
+    denominator is zero. A missing (NaN) price or rate leaves its funds'
+    metrics NaN, so no trade is ever sized off it.
+    """
+    try:
+        # Aggregate futures positions per fund
+        fut = aggregate_futures(positions, funds.index)
+        
+        if isinstance(futures_price, pd.Series):
+            futures_price = futures_price.reindex(funds.index).to_numpy(dtype=float)
+        avg_price = fut['avg_price'].to_numpy(dtype=float)
+        
+        metrics = pd.DataFrame(rebalance_formulas(
+            funds['leverage'].to_numpy(dtype=float),
+            funds['multiplier'].to_numpy(dtype=float),
+            funds['nav'].to_numpy(dtype=float),
+            funds['cf_factor'].to_numpy(dtype=float),
+            funds['currency'].map(fx_rates).to_numpy(dtype=float),
+            futures_price,
+            fut['value_local'].to_numpy(dtype=float),
+            avg_price,
+            fut['value_jpy'].to_numpy(dtype=float),
+        ), index=funds.index)
+        
+        # No futures held: report zeros rather than NaN
+        metrics[np.isnan(avg_price)] = 0
+        return metrics
+        
+    except Exception as e:
+        on_error(f"Error calculating fund metrics: {str(e)}")
+        return pd.DataFrame(0.0, index=funds.index, columns=METRIC_COLUMNS)
+
+def prepare_funds(fund_downloads: Dict, cf_values: Dict[str, float],
+                  fund_config: pd.DataFrame = FUND_CONFIG) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Fund table and stacked positions for every downloaded fund with a valid NAV
+
+    fund_downloads maps fund code to the (positions, fund data, NAV) tuple
+    from download_fund_data; cf_values maps fund code to its cash flow.
+    """
+    navs = pd.Series({code: download[2] for code, download in fund_downloads.items()}, dtype=float)
+    valid_codes = [code for code in fund_config.index if navs.get(code, 0) > 0]
+    if not valid_codes:
+        return fund_config.iloc[:0].assign(nav=[], cf_factor=[]), pd.DataFrame()
+    
+    funds = fund_config.loc[valid_codes].assign(nav=navs[valid_codes])
+    cf = pd.Series(cf_values, dtype=float).reindex(valid_codes).fillna(0.0)
+    funds['cf_factor'] = (cf + funds['nav']) / funds['nav']
+    # Only the columns the metrics read, selected once after stacking
+    sheets = [fund_downloads[code][0] for code in valid_codes]
+    positions = pd.concat(sheets, ignore_index=True)[REQUIRED_POSITION_COLUMNS]
+    positions.insert(0, 'fund_code', np.repeat(valid_codes, [len(sheet) for sheet in sheets]))
+    # concat falls back to object when the funds' category sets differ
+    positions['Category'] = positions['Category'].astype('category')
+    return funds, positions
+
+def fund_prices(funds: pd.DataFrame, fx_rate, futures_price):
+    """JPY rate per currency and futures price per fund for the metrics engine
+
+    fx_rate is one rate for every currency or a dict by currency;
+    futures_price is one price for every fund or a dict by underlying.
+    """
+    fx_rates = fx_rate if isinstance(fx_rate, dict) else dict.fromkeys(funds['currency'].unique(), fx_rate)
+    if isinstance(futures_price, dict):
+        futures_price = funds['underlying'].map(futures_price).astype(float)
+    return fx_rates, futures_price
+
+def compute_rebalance(fund_downloads: Dict, cf_values: Dict[str, float], fx_rate,
+                      futures_price, fund_config: pd.DataFrame = FUND_CONFIG,
+                      on_error: Callable[[str], None] = logger.error) -> pd.DataFrame:
+    """Metrics for every downloaded fund with a valid NAV, indexed by fund code
+
+    fx_rate and futures_price are scalars or per-currency / per-underlying
+    dicts, see fund_prices.
+    """
+    with diagnostics.timed("compute") as timing:
+        # Only funds with a valid NAV go through the metrics engine
+        funds, positions = prepare_funds(fund_downloads, cf_values, fund_config)
+        timing["funds"] = len(funds)
+        if funds.empty:
+            return pd.DataFrame(columns=METRIC_COLUMNS, index=pd.Index([], name='fund_code'))
+        
+        fx_rates, futures_price = fund_prices(funds, fx_rate, futures_price)
+        return calculate_fund_metrics_batch(funds, positions, fx_rates, futures_price, on_error)
+
+def calculate_scenario_grid(funds: pd.DataFrame, positions: pd.DataFrame,
+                            futures_prices, fx_rates, cf_amounts=(0.0,)) -> Dict:
+    """Target position and trade over a futures price x FX rate x CF amount grid
+
+    Uses the same formulas as calculate_fund_metrics_batch, broadcast in one
+    NumPy expression over axes (fund, futures price, FX rate, CF amount), so
+    the already-parsed positions are aggregated once and nothing is fetched.
+    funds needs leverage, multiplier and nav columns; cf_factor is ignored in
+    favour of the cf_amounts axis.
+    """
+    fut = aggregate_futures(positions, funds.index)
+    
+    # Shape every input for broadcasting against (fund, futures, fx, cf)
+    lev_ratio = funds['leverage'].to_numpy(dtype=float)[:, None, None, None]
+    multiplier = funds['multiplier'].to_numpy(dtype=float)[:, None, None, None]
+    nav = funds['nav'].to_numpy(dtype=float)[:, None, None, None]
+    avg_price = fut['avg_price'].to_numpy(dtype=float)[:, None, None, None]
+    value_local = fut['value_local'].to_numpy(dtype=float)[:, None, None, None]
+    futures_axis = np.asarray(futures_prices, dtype=float)[None, :, None, None]
+    fx_axis = np.asarray(fx_rates, dtype=float)[None, None, :, None]
+    cf_axis = np.asarray(cf_amounts, dtype=float)[None, None, None, :]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cf_factor = (cf_axis + nav) / nav
+    metrics = rebalance_formulas(lev_ratio, multiplier, nav, cf_factor, fx_axis, futures_axis,
+                                 value_local, avg_price, np.zeros_like(value_local))
+    target_position = metrics['target_position']
+    target_trade = metrics['target_trade']
+    
+    # No futures held: zeros, as in the live metrics
+    no_futures = np.isnan(avg_price)
+    target_position = np.where(no_futures, 0.0, target_position)
+    target_trade = np.where(no_futures, 0.0, target_trade)
+    
+    return {
+        'fund_codes': list(funds.index),
+        'futures_prices': np.asarray(futures_prices, dtype=float),
+        'fx_rates': np.asarray(fx_rates, dtype=float),
+        'cf_amounts': np.asarray(cf_amounts, dtype=float),
+        'target_position': target_position,
+        'target_trade': target_trade,
+    }
+
+def scenario_table(grid: Dict, fund_code: str, cf_index: int = 0,
+                   metric: str = 'target_trade') -> pd.DataFrame:
+    """One fund's futures price x FX rate slice of a scenario grid as a DataFrame"""
+    fund_index = grid['fund_codes'].index(fund_code)
+    return pd.DataFrame(
+        grid[metric][fund_index, :, :, cf_index],
+        index=pd.Index(grid['futures_prices'], name='Futures Price'),
+        columns=pd.Index(grid['fx_rates'], name='JPY Rate'),
+    )
+
+def export_to_tsv(fund_data: Dict) -> str:
+    """Export fund data to TSV format"""
+    tsv_data = []
+    
+    # Add header
+    tsv_data.append("Fund\tLive Weight\tTarget Trade (Micros)\tCurrent Position\tTarget Position\tInvestment Ratio")
+    
+    # Add fund data
+    for fund_code, data in fund_data.items():
+        tsv_data.append(f"{fund_code}\t{data['live_fund_weight']:.4f}\t{data['target_trade']:.1f}\t"
+                       f"{data['cur_fut_position']:.1f}\t{data['target_position']:.1f}\t{data['prev_inv_ratio']:.4f}")
+    
+    return "\n".join(tsv_data)
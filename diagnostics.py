@@ -0,0 +1,148 @@
+"""Per-stage timing and counters for the fetch -> parse -> compute -> render path
+
+Every instrumented stage appends one record (stage, fund, duration, bytes
+fetched, cache result, retries, source, ok/error) to a bounded in-memory
+window shared by the whole process. The dashboard shows it in its
+Diagnostics panel; `to_prometheus()` and `to_jsonl()` export it, and setting
+FUND_METRICS_FILE writes the Prometheus text after every page render for a
+node_exporter textfile collector.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+METRICS_FILE = os.environ.get("FUND_METRICS_FILE")
+METRIC_PREFIX = "fundtracker"
+WINDOW_SIZE = 5000  # Records kept for quantiles and the panel
+
+class Diagnostics:
+    """Thread-safe, bounded store of stage records"""
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=window_size)
+        self._counters = Counter()
+
+    @contextmanager
+    def timed(self, stage: str, fund: Optional[str] = None, **fields) -> Iterator[Dict]:
+        """Time a block; the yielded dict takes extra fields (bytes, cache, retries, source)
+
+        A block that raises is recorded with ok=False and the error, then re-raised.
+        """
+        record = {"stage": stage, "fund": fund, "bytes": 0, "cache": None, "retries": 0,
+                  "source": None, "ok": True, "error": None, **fields}
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["ok"] = False
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["duration"] = time.perf_counter() - start
+            self.record(**record)
+
+    def record(self, stage: str, duration: float = 0.0, **fields) -> None:
+        record = {"stage": stage, "fund": None, "bytes": 0, "cache": None, "retries": 0,
+                  "source": None, "ok": True, "error": None, **fields,
+                  "duration": duration, "timestamp": time.time()}
+        with self._lock:
+            self._records.append(record)
+            self._counters[("calls", stage)] += 1
+            self._counters[("bytes", stage)] += record["bytes"] or 0
+            self._counters[("retries", stage)] += record["retries"] or 0
+            if not record["ok"]:
+                self._counters[("errors", stage)] += 1
+            if record["cache"]:
+                self._counters[("cache", stage, record["cache"])] += 1
+            if record["source"]:
+                self._counters[("source", stage, record["source"])] += 1
+
+    def records(self, since: Optional[float] = None) -> pd.DataFrame:
+        """Recorded stages as a DataFrame, optionally only those after a timestamp"""
+        with self._lock:
+            records = list(self._records)
+        if since is not None:
+            records = [r for r in records if r["timestamp"] >= since]
+        return pd.DataFrame(records, columns=["timestamp", "stage", "fund", "duration", "bytes",
+                                              "cache", "retries", "source", "ok", "error"])
+
+    def summary(self) -> pd.DataFrame:
+        """Count, p50, p99 and max duration per stage over the window"""
+        records = self.records()
+        if records.empty:
+            return pd.DataFrame(columns=["count", "p50", "p99", "max"])
+        grouped = records.groupby("stage")["duration"]
+        return pd.DataFrame({
+            "count": grouped.size(),
+            "p50": grouped.quantile(0.5),
+            "p99": grouped.quantile(0.99),
+            "max": grouped.max(),
+        })
+
+    def to_jsonl(self) -> str:
+        """One JSON object per record"""
+        with self._lock:
+            records = list(self._records)
+        return "\n".join(json.dumps(record, default=str) for record in records)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition: duration summaries plus cumulative counters"""
+        with self._lock:
+            records = list(self._records)
+            counters = dict(self._counters)
+
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_duration_seconds Stage duration over the recent window",
+            f"# TYPE {METRIC_PREFIX}_stage_duration_seconds summary",
+        ]
+        durations: Dict[str, List[float]] = {}
+        for record in records:
+            durations.setdefault(record["stage"], []).append(record["duration"])
+        for stage, values in sorted(durations.items()):
+            values = np.asarray(values)
+            for quantile in (0.5, 0.9, 0.99):
+                lines.append(f'{METRIC_PREFIX}_stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                             f'{np.quantile(values, quantile):.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_sum{{stage="{stage}"}} {values.sum():.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_count{{stage="{stage}"}} {len(values)}')
+
+        counter_help = {
+            "calls": "Stage executions",
+            "bytes": "Bytes fetched",
+            "retries": "Retries performed",
+            "errors": "Failed stage executions",
+            "cache": "Cache results",
+            "source": "Data source that served the value",
+        }
+        for kind, help_text in counter_help.items():
+            name = f"{METRIC_PREFIX}_{kind}_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(counters.items()):
+                if key[0] != kind:
+                    continue
+                labels = f'stage="{key[1]}"'
+                if kind == "cache":
+                    labels += f',result="{key[2]}"'
+                elif kind == "source":
+                    labels += f',source="{key[2]}"'
+                lines.append(f"{name}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_metrics_file(self, path: Optional[str] = METRICS_FILE) -> None:
+        """Atomically write the Prometheus text to path, if one is configured"""
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+diagnostics = Diagnostics()
@@ -0,0 +1,202 @@
+"""Streaming exports of trades, holdings and history
+
+Every export is a schema plus an iterator of Arrow record batches, written
+out as TSV, CSV, Parquet or an Arrow IPC stream one batch at a time:
+iter_export yields the encoded bytes as each batch is written and
+write_export streams them to disk, so a many-fund, multi-year archive never
+sits in memory as one frame or one string. Archived holdings are scanned
+straight from the Parquet dataset in EXPORT_BATCH_ROWS batches; history
+metrics are computed one fund at a time. Dashboard downloads are generated
+on click into a temporary file (export_file), which Streamlit then serves.
+
+Usage:
+    python export.py holdings --format parquet --output holdings.parquet
+    python export.py history --format arrow --output history.arrows
+    python export.py history-metrics --format csv > metrics.csv
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from core import FUND_CODES, METRIC_COLUMNS, POSITION_ARROW_FIELDS, POSITION_SCHEMA, fetch_all_data
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_ROWS = 64 * 1024
+
+# File extension and MIME type per export format
+EXPORT_FORMATS = {
+    "tsv": ("tsv", "text/tab-separated-values"),
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    # The stream format: batches may carry new dictionaries (each fund and
+    # archive part has its own category set), which the file format rejects
+    "arrow": ("arrows", "application/vnd.apache.arrow.stream"),
+}
+
+Export = Tuple[pa.Schema, Iterator[pa.RecordBatch]]
+
+HOLDINGS_SCHEMA = pa.schema([
+    ("fund_code", pa.string()),
+    *POSITION_ARROW_FIELDS,
+    ("nav", pa.float64()),
+])
+
+def frame_export(frame: pd.DataFrame, rows: int = EXPORT_BATCH_ROWS) -> Export:
+    """An in-memory frame (index included) as an export, sliced into batches"""
+    frame = frame.reset_index()
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    return schema, (
+        pa.RecordBatch.from_pandas(frame.iloc[start:start + rows], schema=schema, preserve_index=False)
+        for start in range(0, len(frame), rows)
+    )
+
+def trades_export(metrics: pd.DataFrame, orders: Optional[pd.DataFrame] = None) -> Export:
+    """Rebalance metrics per fund, with the routed orders alongside when given"""
+    if orders is not None:
+        metrics = metrics.join(orders.add_prefix("order_"))
+    return frame_export(metrics.rename_axis("fund_code"))
+
+def holdings_export(fund_downloads: Dict) -> Export:
+    """Current positions of every downloaded fund, one batch per fund"""
+    def batches():
+        for fund_code, (positions, _, nav) in fund_downloads.items():
+            frame = positions[list(POSITION_SCHEMA)].assign(nav=float(nav))
+            frame.insert(0, "fund_code", fund_code)
+            yield pa.RecordBatch.from_pandas(frame, schema=HOLDINGS_SCHEMA, preserve_index=False)
+    return HOLDINGS_SCHEMA, batches()
+
+def history_export(fund_codes: Optional[List[str]] = None, archive_dir: Optional[str] = None) -> Export:
+    """Every archived position, scanned from the Parquet archive batch by batch"""
+    # archive imports pyarrow.dataset, which only the history exports need
+    import archive
+    import pyarrow.dataset as ds
+
+    archive_dir = archive_dir or archive.ARCHIVE_DIR
+    schema = pa.schema([("fund_code", pa.string()), ("year_month", pa.string()),
+                        *archive.ARCHIVE_COLUMNS.items()])
+    if not os.path.isdir(archive_dir):
+        return schema, iter(())
+    dataset = ds.dataset(
+        archive_dir, format="parquet", partitioning=archive.PARTITIONING,
+        schema=pa.schema(list(archive.ARCHIVE_COLUMNS.items()) + list(archive.PARTITIONING.schema)),
+        exclude_invalid_files=True,
+    )
+    filter_ = ds.field("fund_code").isin(fund_codes) if fund_codes else None
+    batches = dataset.to_batches(columns=schema.names, filter=filter_, batch_size=EXPORT_BATCH_ROWS)
+    return schema, (batch for batch in batches if batch.num_rows)
+
+def history_metrics_export(fund_codes: List[str] = FUND_CODES, archive_dir: Optional[str] = None) -> Export:
+    """Archived rebalance metrics, computed and written one fund at a time"""
+    import archive
+
+    archive_dir = archive_dir or archive.ARCHIVE_DIR
+    schema = pa.schema([("fund_code", pa.string()), ("as_of", pa.timestamp("ns")),
+                        *[(column, pa.float64()) for column in METRIC_COLUMNS]])
+
+    def batches():
+        for fund_code in fund_codes:
+            history = archive.load_history([fund_code], archive_dir)
+            if history.empty:
+                continue
+            metrics = archive.history_metrics(history)
+            yield pa.RecordBatch.from_pandas(metrics[schema.names], schema=schema, preserve_index=False)
+    return schema, batches()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects bytes until drained"""
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _open_writer(fmt: str, sink, schema: pa.Schema):
+    if fmt in ("tsv", "csv"):
+        import pyarrow.csv as csv
+        if fmt == "tsv":
+            options = csv.WriteOptions(delimiter="\t", quoting_style="none", quoting_header="none")
+        else:
+            options = csv.WriteOptions()
+        return csv.CSVWriter(sink, schema, write_options=options)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(sink, schema)
+    if fmt == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    raise ValueError(f"Unknown export format {fmt!r}, expected one of: {', '.join(EXPORT_FORMATS)}")
+
+def iter_export(export: Export, fmt: str) -> Iterator[bytes]:
+    """Encoded export, yielded as each batch is written"""
+    schema, batches = export
+    sink = _ChunkSink()
+    writer = _open_writer(fmt, sink, schema)
+    for batch in batches:
+        writer.write_batch(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+def write_export(export: Export, fmt: str, file) -> int:
+    """Stream an export to a path or binary file; returns the bytes written"""
+    if isinstance(file, str):
+        with open(file, "wb") as f:
+            return write_export(export, fmt, f)
+    written = 0
+    for chunk in iter_export(export, fmt):
+        file.write(chunk)
+        written += len(chunk)
+    return written
+
+def export_file(export: Export, fmt: str) -> io.BufferedReader:
+    """The export streamed to a temporary file, returned open for reading
+
+    The file is unlinked straight away and goes once the handle is closed.
+    """
+    fd, path = tempfile.mkstemp(suffix=f".{EXPORT_FORMATS[fmt][0]}")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_export(export, fmt, f)
+        return open(path, "rb")
+    finally:
+        os.unlink(path)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stream holdings or archived history to a file")
+    parser.add_argument("what", choices=["holdings", "history", "history-metrics"])
+    parser.add_argument("--funds", nargs="+", default=FUND_CODES, help="Fund codes (default: %(default)s)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output", "-o", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+
+    if args.what == "holdings":
+        export = holdings_export({code: download for code, download in fetch_all_data(args.funds).items()
+                                  if download[2] > 0})
+    elif args.what == "history":
+        export = history_export(args.funds)
+    else:
+        export = history_metrics_export(args.funds)
+    write_export(export, args.format, args.output or sys.stdout.buffer)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
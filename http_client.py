@@ -0,0 +1,82 @@
+"""Shared HTTP session for issuer file downloads
+
+One requests.Session per process keeps TLS connections alive between fetches,
+so the handshake (and CA bundle load) happens once per host instead of on
+every download. Each host gets a bounded connection pool; GETs are retried
+with exponential backoff on connection errors and 429/5xx responses, honouring
+Retry-After.
+
+Environment:
+    FUND_HTTP_TIMEOUT     "connect,read" seconds (default "5,30")
+    FUND_HTTP_RETRIES     retry attempts (default 3)
+    FUND_TLS_VERIFY       path to a CA bundle, or "false" to skip verification
+                          (default: verify against certifi's bundle)
+"""
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+def _parse_timeout(value: str) -> Tuple[float, float]:
+    connect, _, read = value.partition(",")
+    return float(connect), float(read or connect)
+
+HTTP_TIMEOUT = _parse_timeout(os.environ.get("FUND_HTTP_TIMEOUT", "5,30"))
+HTTP_RETRIES = int(os.environ.get("FUND_HTTP_RETRIES", "3"))
+MAX_CONNECTIONS_PER_HOST = 8
+RETRY_BACKOFF = 0.5  # seconds; doubles per attempt
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def _tls_verify() -> Union[bool, str]:
+    value = os.environ.get("FUND_TLS_VERIFY", "").strip()
+    if value.lower() in ("0", "false", "no"):
+        logger.warning("TLS certificate verification is disabled (FUND_TLS_VERIFY)")
+        return False
+    return value or True
+
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+def get_session() -> "requests.Session":
+    """The process-wide session, created on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # Imported here so runs served from the cache never load requests/urllib3
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                
+                retry = Retry(
+                    total=HTTP_RETRIES,
+                    backoff_factor=RETRY_BACKOFF,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset({"GET", "HEAD"}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                # pool_block caps concurrent connections per host instead of opening extras
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+                                      max_retries=retry, pool_block=True)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.verify = _tls_verify()
+                _session = session
+    return _session
+
+def http_get(url: str, headers: Optional[Dict[str, str]] = None,
+             timeout: Tuple[float, float] = HTTP_TIMEOUT) -> "requests.Response":
+    """GET through the shared session; non-2xx/304 statuses are left to the caller"""
+    return get_session().get(url, headers=headers, timeout=timeout)
+
+def retries_used(response: "requests.Response") -> int:
+    """How many retries urllib3 made before this response"""
+    retries = getattr(response.raw, "retries", None)
+    return len(retries.history) if retries is not None else 0
@@ -0,0 +1,172 @@
+"""Dependency-tracked, memoized evaluation of the rebalance metrics
+
+The dashboard reruns its whole script on every sidebar edit. RebalanceGraph
+keeps the per-fund intermediates between reruns and recomputes only nodes
+whose inputs actually changed:
+
+    positions[f] ──> futures[f] ──┐
+    nav[f] ─┬────────────────────>├──> metrics[f]
+    cf[f] ──┴──> cf_factor[f] ───>│
+    config[f], fx[currency], futures_price[underlying] ──┘
+
+so moving one fund's CF recomputes that fund's cf_factor and metrics and
+nothing else: no fetch, no parse, no groupby. A new futures price only
+recomputes the funds on that underlying.
+"""
+import logging
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core import METRIC_COLUMNS, rebalance_formulas
+
+logger = logging.getLogger(__name__)
+
+def _same(old: Any, new: Any) -> bool:
+    if old is new:
+        return True
+    if isinstance(old, (pd.DataFrame, pd.Series)) or isinstance(new, (pd.DataFrame, pd.Series)):
+        return type(old) is type(new) and old.equals(new)
+    try:
+        return bool(old == new)
+    except (TypeError, ValueError):
+        return False
+
+class Graph:
+    """Pull-based memoized graph of input and derived nodes
+
+    Inputs carry a version that only moves when set to a different value.
+    A derived node remembers the versions of its dependencies from its last
+    evaluation and recomputes only when one of them has moved.
+    """
+    def __init__(self):
+        self._values: Dict[Hashable, Any] = {}
+        self._versions: Dict[Hashable, int] = {}
+        self._nodes: Dict[Hashable, Tuple[Callable, Tuple[Hashable, ...]]] = {}
+        self._seen: Dict[Hashable, Tuple[int, ...]] = {}
+        self.recomputed = Counter()  # Evaluations per node kind, for diagnostics
+
+    def set_input(self, key: Hashable, value: Any) -> bool:
+        """Set an input; returns whether it changed"""
+        if key in self._values and key not in self._nodes and _same(self._values[key], value):
+            return False
+        self._values[key] = value
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return True
+
+    def define(self, key: Hashable, fn: Callable, *deps: Hashable) -> None:
+        """Declare a derived node computed as fn(*dep_values)"""
+        if key not in self._nodes:
+            self._nodes[key] = (fn, deps)
+
+    def get(self, key: Hashable) -> Any:
+        if key not in self._nodes:
+            return self._values[key]
+        fn, deps = self._nodes[key]
+        dep_values = [self.get(dep) for dep in deps]
+        dep_versions = tuple(self._versions[dep] for dep in deps)
+        if self._seen.get(key) != dep_versions:
+            self._values[key] = fn(*dep_values)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._seen[key] = dep_versions
+            self.recomputed[key[0] if isinstance(key, tuple) else key] += 1
+        return self._values[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._values or key in self._nodes
+
+def _aggregate_fund_futures(positions: pd.DataFrame) -> Dict[str, float]:
+    fut = positions[positions.Category == "Future"]
+    if fut.empty:
+        return {"value_local": np.nan, "avg_price": np.nan, "value_jpy": np.nan}
+    return {
+        "value_local": float(fut["Value(Local)"].sum()),
+        "avg_price": float(fut["Price"].mean()),
+        "value_jpy": float(fut["Value(JPY)"].sum()),
+    }
+
+def _cf_factor(cf: float, nav: float) -> float:
+    return (cf + nav) / nav
+
+def _fund_metrics(config: Dict, futures: Dict[str, float], nav: float, cf_factor: float,
+                  fx_rate: float, futures_price: float) -> Dict[str, float]:
+    if np.isnan(futures["avg_price"]):
+        # No futures held: zeros, as in the batch engine
+        return {column: 0.0 for column in METRIC_COLUMNS}
+    metrics = rebalance_formulas(
+        float(config["leverage"]), float(config["multiplier"]), nav, cf_factor,
+        fx_rate, futures_price,
+        futures["value_local"], futures["avg_price"], futures["value_jpy"],
+    )
+    # A missing price stays NaN, as in the batch engine
+    return {column: float(value) for column, value in metrics.items()}
+
+class RebalanceGraph:
+    """Per-session incremental view of compute_rebalance"""
+    def __init__(self, fund_config: pd.DataFrame):
+        self.fund_config = fund_config
+        self.graph = Graph()
+        for fund_code, config in fund_config.iterrows():
+            self.graph.set_input(("config", fund_code), config.to_dict())
+
+    def _define_fund(self, fund_code: str) -> None:
+        graph = self.graph
+        config = self.fund_config.loc[fund_code]
+        for key in (("fx", config["currency"]), ("futures_price", config["underlying"])):
+            if key not in graph:
+                graph.set_input(key, np.nan)
+        graph.define(("futures", fund_code), _aggregate_fund_futures, ("positions", fund_code))
+        graph.define(("cf_factor", fund_code), _cf_factor, ("cf", fund_code), ("nav", fund_code))
+        graph.define(("metrics", fund_code), _fund_metrics,
+                     ("config", fund_code), ("futures", fund_code), ("nav", fund_code),
+                     ("cf_factor", fund_code), ("fx", config["currency"]),
+                     ("futures_price", config["underlying"]))
+
+    def update(self, fund_downloads: Optional[Dict] = None, cf_values: Optional[Dict[str, float]] = None,
+               fx_rate=None, futures_price=None) -> None:
+        """Feed any subset of the inputs; unchanged values invalidate nothing
+
+        fx_rate and futures_price take a scalar or a per-currency /
+        per-underlying dict, as in core.compute_rebalance.
+        """
+        graph = self.graph
+        if fund_downloads is not None:
+            for fund_code, (positions, _, nav) in fund_downloads.items():
+                if fund_code not in self.fund_config.index:
+                    continue
+                graph.set_input(("positions", fund_code), positions)
+                graph.set_input(("nav", fund_code), float(nav))
+                if ("cf", fund_code) not in graph:
+                    graph.set_input(("cf", fund_code), 0.0)
+                self._define_fund(fund_code)
+        if cf_values is not None:
+            for fund_code, cf in cf_values.items():
+                graph.set_input(("cf", fund_code), float(cf))
+        if fx_rate is not None:
+            if not isinstance(fx_rate, dict):
+                fx_rate = dict.fromkeys(self.fund_config["currency"].unique(), fx_rate)
+            for currency, rate in fx_rate.items():
+                graph.set_input(("fx", currency), float(rate))
+        if futures_price is not None:
+            if not isinstance(futures_price, dict):
+                futures_price = dict.fromkeys(self.fund_config["underlying"].unique(), futures_price)
+            for underlying, price in futures_price.items():
+                graph.set_input(("futures_price", underlying), float(price))
+
+    def metrics(self, on_error: Callable[[str], None] = logger.error) -> pd.DataFrame:
+        """Metrics for every configured fund with a valid NAV, indexed by fund code"""
+        graph = self.graph
+        valid_codes = [
+            code for code in self.fund_config.index
+            if ("nav", code) in graph and graph.get(("nav", code)) > 0
+        ]
+        try:
+            rows = {code: graph.get(("metrics", code)) for code in valid_codes}
+        except Exception as e:
+            on_error(f"Error calculating fund metrics: {str(e)}")
+            rows = {code: dict.fromkeys(METRIC_COLUMNS, 0.0) for code in valid_codes}
+        frame = pd.DataFrame.from_dict(rows, orient="index", columns=METRIC_COLUMNS)
+        frame.index.name = "fund_code"
+        return frame
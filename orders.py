@@ -0,0 +1,168 @@
+"""Integer futures orders from fractional target trades
+
+The metrics engine gives each fund a fractional target trade in its own
+position units ("Micros", the fund's contract multiplier). route_orders turns
+those into whole orders across the contracts listed for the fund's
+underlying in contracts.csv (e.g. ES and MES), minimising
+
+    tracking_weight * |unfilled target| * multiplier * price + sum(cost * |contracts|)
+
+per fund, with each order within the contract's max_order. The search is a
+handful of candidates around the greedy split, evaluated for all funds at
+once in NumPy, so it is cheap enough to run on every quote tick.
+
+Orders go to the front quarterly expiry until roll_days before it expires,
+then to the next one; contract_symbols names the expiry in use.
+"""
+import itertools
+import os
+from datetime import date, timedelta
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from core import FUND_CONFIG
+from diagnostics import diagnostics
+
+# Tradable contracts per underlying: point value (in the fund currency), cost
+# per contract (commission plus half the spread, same currency), the largest
+# single order, the expiry cycle as month codes and the roll window in days
+CONTRACTS_PATH = os.environ.get(
+    "FUND_CONTRACTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "contracts.csv")
+)
+CONTRACT_DTYPES = {
+    "underlying": str, "contract": str, "multiplier": float, "cost": float,
+    "max_order": int, "expiry_months": str, "roll_days": int,
+}
+MONTH_CODES = "FGHJKMNQUVXZ"  # January to December
+
+def load_contracts(path: str = CONTRACTS_PATH) -> pd.DataFrame:
+    """Read and validate the contract table, indexed by contract"""
+    contracts = pd.read_csv(path, dtype=CONTRACT_DTYPES, keep_default_na=False)
+    missing = set(CONTRACT_DTYPES) - set(contracts.columns)
+    if missing:
+        raise ValueError(f"Contract table {path} is missing columns: {', '.join(sorted(missing))}")
+    duplicated = contracts["contract"][contracts["contract"].duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(f"Contract table {path} lists contracts more than once: {', '.join(duplicated)}")
+    bad_months = contracts["contract"][~contracts["expiry_months"].map(
+        lambda months: bool(months) and set(months) <= set(MONTH_CODES))]
+    if len(bad_months):
+        raise ValueError(f"Contract table {path} has invalid expiry months for: {', '.join(bad_months)}")
+    if (contracts["multiplier"] <= 0).any() or (contracts["max_order"] < 0).any():
+        raise ValueError(f"Contract table {path} needs positive multipliers and non-negative max_order")
+    return contracts.set_index("contract")
+
+CONTRACTS = load_contracts()
+
+def third_friday(year: int, month: int) -> date:
+    first = date(year, month, 1)
+    return first + timedelta(days=(4 - first.weekday()) % 7 + 14)
+
+def active_expiry(expiry_months: str, when: date, roll_days: int) -> date:
+    """Expiry that new orders go to: the nearest one not yet within roll_days"""
+    months = sorted(MONTH_CODES.index(code) + 1 for code in expiry_months)
+    year = when.year
+    while True:
+        for month in months:
+            expiry = third_friday(year, month)
+            if when < expiry - timedelta(days=roll_days):
+                return expiry
+        year += 1
+
+def contract_symbols(when: date, contracts: pd.DataFrame = CONTRACTS) -> pd.Series:
+    """Exchange symbol of the expiry in use per contract, e.g. ESZ6"""
+    symbols = {}
+    for contract, row in contracts.iterrows():
+        expiry = active_expiry(row["expiry_months"], when, row["roll_days"])
+        symbols[contract] = f"{contract}{MONTH_CODES[expiry.month - 1]}{expiry.year % 10}"
+    return pd.Series(symbols, dtype=str)
+
+def _route(targets: np.ndarray, notional: np.ndarray, sizes: np.ndarray, costs: np.ndarray,
+           limits: np.ndarray, tracking_weight: float) -> np.ndarray:
+    """Best integer contract counts (fund x contract) for fractional targets in fund units
+
+    sizes are each fund's contract sizes in its own units (fund x contract),
+    largest first; notional is the value of one fund unit. Every contract
+    but the smallest tries the greedy count and one either side, none, and
+    the fewest (or one more) that leaves any set of the smaller contracts
+    within their limits; the smallest tries the counts either side of what
+    is left, and none. That matches exhaustive search when each size is a
+    whole multiple of the next, as in a contract family like ES/MES.
+    """
+    n_funds, n_contracts = sizes.shape
+    # Per contract: what each set of the smaller contracts trades at most, in fund units
+    reaches = [[(limits[list(later)] * sizes[:, list(later)]).sum(axis=1)
+                for k in range(1, n_contracts - j) for later in itertools.combinations(range(j + 1, n_contracts), k)]
+               for j in range(n_contracts - 1)]
+    choices = [[-1, 0, 1, "none"] + [(reach, plus) for reach in range(len(reaches[j])) for plus in (0, 1)]
+               for j in range(n_contracts - 1)] + [["floor", "ceil", "none"]]
+    offsets = list(itertools.product(*choices))
+
+    counts = np.zeros((n_funds, len(offsets), n_contracts))
+    remaining = np.repeat(targets[:, None], len(offsets), axis=1)
+    for j in range(n_contracts):
+        choice = [offset[j] for offset in offsets]
+        left = remaining / sizes[:, j, None]
+        if j < n_contracts - 1:
+            count = np.fix(left) + np.array([step if isinstance(step, int) else 0 for step in choice], dtype=float)
+            count[:, [step == "none" for step in choice]] = 0.0
+            for i, reach in enumerate(reaches[j]):
+                # The fewest of this contract that the smaller ones in the set can make up the rest of
+                forced = np.sign(left) * np.floor(np.maximum(np.abs(remaining) - reach[:, None], 0) / sizes[:, j, None])
+                for plus in (0, 1):
+                    chosen = [step == (i, plus) for step in choice]
+                    count[:, chosen] = (forced + plus * np.sign(left))[:, chosen]
+        else:
+            count = np.where(np.array(choice) == "floor", np.floor(left),
+                             np.where(np.array(choice) == "ceil", np.ceil(left), 0.0))
+        count = np.clip(count, -limits[j], limits[j])
+        counts[:, :, j] = count
+        remaining = remaining - count * sizes[:, j, None]
+
+    objective = tracking_weight * np.abs(remaining) * notional[:, None] + np.abs(counts) @ costs
+    best = objective.argmin(axis=1)
+    return counts[np.arange(n_funds), best].astype(int)
+
+def route_orders(target_trades: pd.Series, futures_prices: Dict[str, float],
+                 fund_config: pd.DataFrame = FUND_CONFIG, contracts: pd.DataFrame = CONTRACTS,
+                 tracking_weight: float = 1.0) -> pd.DataFrame:
+    """Integer orders per fund and contract for the target trades (indexed by fund code)
+
+    Returns a frame indexed by fund code with one order count column per
+    contract, plus routed_trade (the orders in fund units), residual (target
+    minus routed) and cost. Funds whose underlying has no contracts get no
+    orders and the whole target as residual.
+    """
+    with diagnostics.timed("orders") as timing:
+        timing["funds"] = len(target_trades)
+        config = fund_config.loc[target_trades.index]
+        targets = target_trades.to_numpy(dtype=float)
+        orders = pd.DataFrame(0, index=target_trades.index, columns=contracts.index)
+        routed = np.zeros(len(targets))
+        cost = np.zeros(len(targets))
+
+        for underlying, tradable in contracts.groupby("underlying", sort=False):
+            in_group = (config["underlying"] == underlying).to_numpy()
+            if not in_group.any():
+                continue
+            tradable = tradable.sort_values("multiplier", ascending=False)
+            fund_multiplier = config["multiplier"].to_numpy(dtype=float)[in_group]
+            # Contract sizes in each fund's own position units
+            sizes = tradable["multiplier"].to_numpy(dtype=float)[None, :] / fund_multiplier[:, None]
+
+            notional = fund_multiplier * futures_prices[underlying]
+            counts = _route(np.nan_to_num(targets[in_group]), notional, sizes,
+                            tradable["cost"].to_numpy(dtype=float), tradable["max_order"].to_numpy(dtype=float), tracking_weight)
+            orders.loc[in_group, tradable.index] = counts
+            routed[in_group] = (counts * sizes).sum(axis=1)
+            cost[in_group] = np.abs(counts) @ tradable["cost"].to_numpy(dtype=float)
+
+        return orders.assign(routed_trade=routed, residual=targets - routed, cost=cost)
+
+def format_orders(orders: pd.Series, symbols: pd.Series) -> str:
+    """One fund's non-zero orders, e.g. "ESZ6 -12, MESZ6 +3" ("-" for none)"""
+    legs = [f"{symbols[contract]} {int(orders[contract]):+d}" for contract in symbols.index
+            if contract in orders.index and orders[contract] != 0]
+    return ", ".join(legs) if legs else "-"
@@ -0,0 +1,221 @@
+"""Shared market snapshot for multi-viewer serving
+
+In serving mode one data-worker process owns every upstream call: it fetches
+and parses the fund files and polls quotes, then publishes the result to a
+snapshot directory (ideally on tmpfs, e.g. /dev/shm):
+
+    positions.arrow   typed positions of every fund as one Arrow IPC table,
+                      each fund's NAV and row count in the schema metadata
+    quotes.json       latest quotes and poller status
+
+Both are replaced atomically. Dashboard processes memory-map positions.arrow,
+so its pages are shared through the OS page cache, and each process decodes
+a new publication once for all of its sessions. N viewers cost the upstream
+and CPU load of one.
+
+    FUND_SNAPSHOT_DIR=/dev/shm/fundtracker python snapshot.py
+    FUND_SNAPSHOT_DIR=/dev/shm/fundtracker streamlit run Hello.py
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from core import (
+    CACHE_FRESH_SECONDS,
+    FUND_CODES,
+    POLL_INTERVAL,
+    POSITION_ARROW_FIELDS,
+    POSITION_SCHEMA,
+    QUOTE_SYMBOLS,
+    download_quotes,
+    failed_market_snapshot,
+    fetch_all_data,
+    refreshed_market_snapshot,
+    stored_market_snapshot,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get("FUND_SNAPSHOT_DIR")  # Set to serve from a data worker
+POSITIONS_FILE = "positions.arrow"
+QUOTES_FILE = "quotes.json"
+REFRESH_FILE = "refresh"  # Touched by a dashboard to ask for an immediate refresh
+
+POSITIONS_ARROW_SCHEMA = pa.schema([
+    *POSITION_ARROW_FIELDS,
+])
+
+def _replace(path: str, write) -> None:
+    """Write through a dot-prefixed temp file, then rename over path"""
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def publish_positions(snapshot_dir: str, fund_downloads: Dict) -> None:
+    """Write every fund's positions and NAV as one Arrow IPC file
+
+    The funds' category sets differ (and a failed fund has none), while an
+    IPC file allows one dictionary per column, so the per-fund batches are
+    unified into one table before writing.
+    """
+    funds = [{"fund_code": code, "nav": float(nav), "rows": len(positions)}
+             for code, (positions, _, nav) in fund_downloads.items()]
+    schema = POSITIONS_ARROW_SCHEMA.with_metadata({"funds": json.dumps(funds)})
+    table = pa.Table.from_batches([
+        pa.RecordBatch.from_pandas(positions[list(POSITION_SCHEMA)], schema=POSITIONS_ARROW_SCHEMA,
+                                   preserve_index=False)
+        for positions, _, _ in fund_downloads.values()
+    ], schema=schema).unify_dictionaries()
+
+    def write(path):
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+    _replace(os.path.join(snapshot_dir, POSITIONS_FILE), write)
+
+def publish_quotes(snapshot_dir: str, market: Dict) -> None:
+    """Write the quote snapshot in the shape MarketDataPoller.snapshot() returns"""
+    payload = {**market, "updated": market["updated"].isoformat() if market["updated"] else None}
+
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(payload, f)
+    _replace(os.path.join(snapshot_dir, QUOTES_FILE), write)
+
+class SnapshotReader:
+    """Process-wide reader that decodes each publication once
+
+    Files are re-read only when their inode or mtime changes; otherwise the
+    same objects are returned, so per-session memoization keeps hitting.
+    """
+    def __init__(self, snapshot_dir: str):
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        self._versions: Dict[str, Tuple[int, int]] = {}
+        self._fund_downloads: Dict = {}
+        self._market = {"quotes": {}, "quote_times": {}, "updated": None, "error": None, "rate_limited": False}
+
+    def _new_version(self, name: str) -> Optional[Tuple[int, int]]:
+        """The file's (inode, mtime) if it differs from the last one read, else None"""
+        try:
+            stat = os.stat(os.path.join(self.snapshot_dir, name))
+        except FileNotFoundError:
+            return None
+        version = (stat.st_ino, stat.st_mtime_ns)
+        return None if self._versions.get(name) == version else version
+
+    def fund_downloads(self) -> Dict:
+        """Fund code -> (positions, fund data, NAV), as from core.fetch_all_data"""
+        with self._lock:
+            version = self._new_version(POSITIONS_FILE)
+            if version:
+                # Memory-mapped: Arrow reads the batches straight from the shared pages
+                source = pa.memory_map(os.path.join(self.snapshot_dir, POSITIONS_FILE))
+                reader = pa.ipc.open_file(source)
+                funds = json.loads(reader.schema.metadata[b"funds"])
+                table = reader.read_all()
+                self._fund_downloads, start = {}, 0
+                for fund in funds:
+                    positions = table.slice(start, fund["rows"]).to_pandas()
+                    self._fund_downloads[fund["fund_code"]] = (positions, pd.DataFrame(), fund["nav"])
+                    start += fund["rows"]
+                self._versions[POSITIONS_FILE] = version
+            return self._fund_downloads
+
+    def market(self) -> Dict:
+        with self._lock:
+            version = self._new_version(QUOTES_FILE)
+            if version:
+                self._versions[QUOTES_FILE] = version
+                try:
+                    with open(os.path.join(self.snapshot_dir, QUOTES_FILE)) as f:
+                        market = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Unreadable quote snapshot: {e}")
+                else:
+                    market["updated"] = datetime.fromisoformat(market["updated"]) if market["updated"] else None
+                    self._market = market
+            return dict(self._market)
+
+    def request_refresh(self) -> None:
+        with open(os.path.join(self.snapshot_dir, REFRESH_FILE), "w") as f:
+            f.write(str(time.time()))
+
+class SnapshotMarketData:
+    """Stand-in for MarketDataPoller that reads the data worker's quotes"""
+    def __init__(self, reader: SnapshotReader):
+        self.reader = reader
+
+    def snapshot(self, timeout: float = 0.0) -> Dict:
+        """Latest published quotes; waits up to timeout only until the first publication"""
+        deadline = time.time() + timeout
+        market = self.reader.market()
+        while market["updated"] is None and market["error"] is None and time.time() < deadline:
+            time.sleep(0.1)
+            market = self.reader.market()
+        return market
+
+    def refresh_now(self):
+        self.reader.request_refresh()
+
+def run_worker(snapshot_dir: str, fund_codes: List[str], interval: float = POLL_INTERVAL,
+               fund_interval: float = CACHE_FRESH_SECONDS) -> None:
+    """Poll quotes every interval and fund files every fund_interval, publishing each result"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    refresh_path = os.path.join(snapshot_dir, REFRESH_FILE)
+    market = stored_market_snapshot(QUOTE_SYMBOLS)
+    funds_fetched = 0.0
+    refresh_seen = os.path.getmtime(refresh_path) if os.path.exists(refresh_path) else 0.0
+
+    while True:
+        refresh_requested = os.path.exists(refresh_path) and os.path.getmtime(refresh_path) > refresh_seen
+        if refresh_requested:
+            refresh_seen = os.path.getmtime(refresh_path)
+
+        try:
+            if refresh_requested or time.time() - funds_fetched >= fund_interval:
+                # A dashboard refresh revalidates with the issuer, like the in-process refresh
+                fund_downloads = fetch_all_data(fund_codes, max_cache_age=0 if refresh_requested else fund_interval)
+                publish_positions(snapshot_dir, fund_downloads)
+                funds_fetched = time.time()
+
+            try:
+                market = refreshed_market_snapshot(market, download_quotes(QUOTE_SYMBOLS))
+            except Exception as e:
+                # Keep publishing the last good quotes with the failure noted
+                market = failed_market_snapshot(market, e)
+            publish_quotes(snapshot_dir, market)
+        except Exception:
+            # Viewers keep the last publication; try again next poll
+            logger.exception("Snapshot publication failed")
+
+        next_poll = time.time() + interval
+        while time.time() < next_poll:
+            if os.path.exists(refresh_path) and os.path.getmtime(refresh_path) > refresh_seen:
+                break
+            time.sleep(0.5)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Data worker publishing the shared market snapshot")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="Snapshot directory (default: $FUND_SNAPSHOT_DIR)")
+    parser.add_argument("--funds", nargs="+", default=FUND_CODES, help="Fund codes (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="Quote poll seconds")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    if not args.dir:
+        parser.error("--dir or FUND_SNAPSHOT_DIR is required")
+
+    logger.info(f"Publishing snapshots to {args.dir}")
+    run_worker(args.dir, args.funds, args.interval)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
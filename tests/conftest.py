@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Keep the tests' cache away from the real one; must be set before core is imported
+os.environ.setdefault("FUND_CACHE_DIR", os.path.join(tempfile.mkdtemp(prefix="fundtracker-test-"), "portfolio"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
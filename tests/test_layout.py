@@ -0,0 +1,63 @@
+import io
+import os
+
+import openpyxl
+import pandas as pd
+import pytest
+import xlrd
+
+import core
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+
+@pytest.fixture(autouse=True)
+def fresh_layouts():
+    core._layouts.clear()
+    yield
+    core._layouts.clear()
+
+def fixture(fund_code: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, f"{fund_code}.xls"), "rb") as f:
+        return f.read()
+
+def as_xlsx(contents: bytes, edit=None, top: int = 0, left: int = 0) -> bytes:
+    """The fixture rewritten as .xlsx, shifted down/right and with edit(row_index, values) applied"""
+    sheet = xlrd.open_workbook(file_contents=contents).sheet_by_index(0)
+    workbook = openpyxl.Workbook()
+    for _ in range(top):
+        workbook.active.append([])
+    for r in range(sheet.nrows):
+        values = [None] * left + [value if value != "" else None for value in sheet.row_values(r)]
+        if edit:
+            edit(r, values)
+        workbook.active.append(values)
+    out = io.BytesIO()
+    workbook.save(out)
+    return out.getvalue()
+
+@pytest.mark.parametrize("fund_code", ["2239", "2240"])
+def test_fixture_layout(fund_code):
+    positions, fund_data, nav = core.parse_fund_workbook(fixture(fund_code), "Nikko")
+    assert nav > 0
+    assert fund_data.at[0, "Fund Code"] == fund_code
+    assert list(positions.columns) == list(core.POSITION_SCHEMA)
+    assert len(positions) and positions["Value(JPY)"].notna().all()
+
+def test_shifted_xlsx_parses_the_same():
+    expected, _, nav = core.parse_fund_workbook(fixture("2239"), "Nikko")
+    positions, _, shifted_nav = core.parse_fund_workbook(as_xlsx(fixture("2239"), top=2, left=1), "Nikko")
+    pd.testing.assert_frame_equal(positions, expected)
+    assert shifted_nav == nav
+
+def test_blank_summary_label_under_a_cached_layout():
+    core.parse_fund_workbook(as_xlsx(fixture("2239")), "Nikko")
+    blank = as_xlsx(fixture("2239"), edit=lambda r, values: values.__setitem__(0, None) if r == 5 else None)
+    positions, fund_data, nav = core.parse_fund_workbook(blank, "Nikko")
+    assert nav > 0
+    assert "Units Outstanding" not in fund_data.columns and len(positions)
+
+def test_missing_header_is_a_layout_error():
+    no_header = as_xlsx(fixture("2239"), edit=lambda r, values: values.__setitem__(
+        slice(None), [None if value == "Value(JPY)" else value for value in values]))
+    with pytest.raises(core.WorkbookLayoutError):
+        core.parse_fund_workbook(no_header)
@@ -0,0 +1,47 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from orders import _route
+
+def objective(target, notional, sizes, costs, counts, tracking_weight):
+    return tracking_weight * abs(target - counts @ sizes) * notional + np.abs(counts) @ costs
+
+def brute_force(target, notional, sizes, costs, limits, tracking_weight):
+    """Lowest objective over every count combination within the limits"""
+    return min(
+        objective(target, notional, sizes, costs, np.array(counts, dtype=float), tracking_weight)
+        for counts in itertools.product(*(range(-int(limit), int(limit) + 1) for limit in limits))
+    )
+
+@pytest.mark.parametrize("n_contracts", [2, 3])
+def test_route_matches_exhaustive_search(n_contracts):
+    rng = np.random.default_rng(n_contracts)
+    for _ in range(150):
+        # Each size a whole multiple of the next, as in ES/MES
+        ratios = rng.integers(2, 11 if n_contracts == 2 else 5, n_contracts - 1)
+        sizes = np.append(np.cumprod(ratios[::-1])[::-1], 1.0) * rng.choice([0.5, 1.0, 2.0])
+        costs = rng.uniform(0, 20, n_contracts)
+        limits = rng.integers(1, 30 if n_contracts == 2 else 10, n_contracts).astype(float)
+        target, notional = rng.uniform(-60, 60), rng.uniform(0.5, 20)
+        tracking_weight = rng.choice([1.0, 0.1, 0.01])
+
+        counts = _route(np.array([target]), np.array([notional]), sizes[None, :], costs, limits, tracking_weight)[0]
+        assert (np.abs(counts) <= limits).all()
+        assert objective(target, notional, sizes, costs, counts.astype(float), tracking_weight) == pytest.approx(
+            brute_force(target, notional, sizes, costs, limits, tracking_weight), abs=1e-9)
+
+def test_route_clips_to_limits():
+    counts = _route(np.array([-500.0]), np.array([100.0]), np.array([[10.0, 1.0]]),
+                    np.array([8.5, 1.25]), np.array([20.0, 30.0]), 1.0)
+    assert counts.tolist() == [[-20, -30]]
+
+def test_route_funds_independently():
+    targets = np.array([-116.2, 135.5, 0.0])
+    sizes = np.tile([10.0, 1.0], (3, 1))
+    costs, limits = np.array([8.5, 1.25]), np.array([2000.0, 20000.0])
+    together = _route(targets, np.full(3, 1e5), sizes, costs, limits, 1.0)
+    alone = [_route(targets[[i]], np.full(1, 1e5), sizes[[i]], costs, limits, 1.0)[0] for i in range(3)]
+    assert together.tolist() == [counts.tolist() for counts in alone]
+    assert together[2].tolist() == [0, 0]
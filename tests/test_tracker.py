@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from tracker import LiveTracker, RingBuffer
+
+FUND_CONFIG = pd.DataFrame({"leverage": [2.0], "underlying": ["ES"], "currency": ["USD"]}, index=["2239"])
+
+def record(tracker, weights, start=datetime(2026, 10, 16, 9)):
+    for i, weight in enumerate(weights):
+        metrics = pd.DataFrame({"live_fund_weight": [weight], "target_trade": [0.0]}, index=["2239"])
+        tracker.record(start + timedelta(seconds=15 * i), metrics, FUND_CONFIG, {"USD": 150.0}, {"ES": 6000.0})
+
+def test_ring_buffer_keeps_the_latest_ticks_oldest_first():
+    buffer = RingBuffer(4, np.dtype([("x", "f8")]))
+    for x in range(10):
+        buffer.append((x,))
+    assert len(buffer) == 4
+    assert buffer.to_array()["x"].tolist() == [6, 7, 8, 9]
+    assert buffer.to_array(rows=2)["x"].tolist() == [8, 9]
+    assert buffer.ago(0)["x"] == 9 and buffer.ago(3)["x"] == 6
+
+def test_rolling_drift_matches_a_rolling_mean_across_wraparound():
+    weights = 2.0 + np.random.default_rng(0).normal(0, 0.05, 50)
+    tracker = LiveTracker(capacity=7, window=5)
+    record(tracker, weights)
+
+    expected = pd.Series(weights - 2.0).rolling(5, min_periods=1).mean().to_numpy()[-7:]
+    np.testing.assert_allclose(tracker.frame("rolling_drift")["2239"].to_numpy(), expected)
+
+def test_stale_ticks_are_ignored():
+    tracker = LiveTracker(capacity=10, window=3)
+    record(tracker, [2.1, 2.2])
+    metrics = pd.DataFrame({"live_fund_weight": [9.0], "target_trade": [0.0]}, index=["2239"])
+    assert not tracker.record(tracker.last_tick, metrics, FUND_CONFIG, {"USD": 150.0}, {"ES": 6000.0})
+    assert len(tracker.buffers["2239"]) == 2
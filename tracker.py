@@ -0,0 +1,104 @@
+"""Live weight-drift tracker over a trading session of quote ticks
+
+Every new quote snapshot is one tick. For each fund the tracker appends the
+tick's futures price, FX rate, live weight, its drift from the fund's target
+weight (its leverage), the rolling mean of that drift and the implied
+rebalance (target trade) to a fixed-size NumPy ring buffer, so memory stays
+bounded however long the page is left open. The rolling drift is kept as a
+running sum, so each tick costs O(1) per fund.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from core import POLL_INTERVAL
+
+SESSION_TICKS = 24 * 3600 // POLL_INTERVAL  # One tick per poll for a full day
+DRIFT_WINDOW = 20  # Ticks in the rolling drift (5 minutes at the default poll)
+
+TICK_DTYPE = np.dtype([
+    ("timestamp", "datetime64[ms]"),
+    ("futures_price", "f8"),
+    ("fx_rate", "f8"),
+    ("live_fund_weight", "f8"),
+    ("drift", "f8"),
+    ("rolling_drift", "f8"),
+    ("target_trade", "f8"),
+])
+
+class RingBuffer:
+    """Fixed-capacity record array; appends overwrite the oldest tick once full"""
+    def __init__(self, capacity: int, dtype: np.dtype = TICK_DTYPE):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.count = 0  # Ticks ever appended
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, row: tuple) -> None:
+        self._data[self.count % self.capacity] = row
+        self.count += 1
+
+    def ago(self, n: int) -> np.void:
+        """The tick appended n ticks before the latest one (0 = latest)"""
+        return self._data[(self.count - 1 - n) % self.capacity]
+
+    def to_array(self, rows: Optional[int] = None) -> np.ndarray:
+        """Held ticks, oldest first; rows keeps just the latest ones"""
+        held = len(self) if rows is None else min(rows, len(self))
+        return self._data[np.arange(self.count - held, self.count) % self.capacity]
+
+class LiveTracker:
+    """Per-fund ring buffers of drift and implied rebalance, fed one tick at a time"""
+    def __init__(self, capacity: int = SESSION_TICKS, window: int = DRIFT_WINDOW):
+        self.capacity = max(capacity, window)
+        self.window = window
+        self.buffers: Dict[str, RingBuffer] = {}
+        self._drift_sums: Dict[str, float] = {}
+        self.last_tick: Optional[datetime] = None
+
+    def record(self, timestamp: datetime, metrics: pd.DataFrame, fund_config: pd.DataFrame,
+               fx_rates: Dict[str, float], futures_prices: Dict[str, float]) -> bool:
+        """Append one tick for every fund in metrics
+
+        A timestamp no newer than the last recorded tick is ignored (the
+        page reran without a new quote); returns whether a tick was added.
+        """
+        if self.last_tick is not None and timestamp <= self.last_tick:
+            return False
+        self.last_tick = timestamp
+        stamp = np.datetime64(timestamp, "ms")
+
+        for fund_code, row in metrics.iterrows():
+            config = fund_config.loc[fund_code]
+            buffer = self.buffers.get(fund_code)
+            if buffer is None:
+                buffer = self.buffers[fund_code] = RingBuffer(self.capacity)
+                self._drift_sums[fund_code] = 0.0
+
+            drift = row["live_fund_weight"] - config["leverage"]
+            # Running sum over the last `window` drifts: add the new one, drop the one leaving
+            self._drift_sums[fund_code] += drift
+            if buffer.count >= self.window:
+                self._drift_sums[fund_code] -= buffer.ago(self.window - 1)["drift"]
+            rolling_drift = self._drift_sums[fund_code] / min(buffer.count + 1, self.window)
+
+            buffer.append((stamp, futures_prices[config["underlying"]], fx_rates[config["currency"]],
+                           row["live_fund_weight"], drift, rolling_drift, row["target_trade"]))
+        return True
+
+    def frame(self, field: str, rows: Optional[int] = None) -> pd.DataFrame:
+        """One field as a chart-ready frame: a column per fund, indexed by tick time
+
+        rows limits it to the latest ticks, e.g. rows=1 for the one just recorded.
+        """
+        columns = {}
+        for fund_code, buffer in self.buffers.items():
+            ticks = buffer.to_array(rows)
+            columns[fund_code] = pd.Series(ticks[field], index=pd.DatetimeIndex(ticks["timestamp"]))
+        frame = pd.DataFrame(columns)
+        frame.index.name = "time"
+        return frame